@@ -1,21 +1,36 @@
 import os
+import json
+import base64
+import uuid
 import logging
+import threading
 import uvicorn
 from datetime import datetime # <--- IMPORTANTE: Para guardar fecha y hora
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Header, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 
 # --- NUEVO: Importar MongoDB ---
 from dotenv import load_dotenv
 load_dotenv()
-from pymongo import MongoClient
+from utils.persistence import MONGO_SPOOL_PATH, MongoWriter, create_client
+from utils.audit import AuditStore, registro_auditoria
+import utils.shadow as shadow
 
 # Importaciones locales
 import utils.schemas as schemas
+import utils.metrics as metrics
 import utils.inference as inference
 import utils.explainability as explainability
+import utils.streaming as streaming
+from utils.batching import MicroBatcher
+from utils.explanation_store import ExplanationStore
+from utils.registry import ModelWatcher, list_versions
+from utils.velocity import VELOCITY_SNAPSHOT_PATH, SnapshotWriter
+from utils.workers import reclamar_huerfanos, ruta_propia
 
 # Configuración de Logs
 logging.basicConfig(level=logging.INFO)
@@ -33,14 +48,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Header Server-Timing con el desglose por etapa: siempre (SERVER_TIMING=1)
+# o solo cuando el cliente lo pide con "X-Server-Timing: 1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+@app.middleware("http")
+async def stage_timings_middleware(request: Request, call_next):
+    timings = metrics.start_request()
+    response = await call_next(request)
+    if SERVER_TIMING or request.headers.get("x-server-timing") == "1":
+        header = metrics.server_timing_header(timings)
+        if header:
+            response.headers["Server-Timing"] = header
+    return response
+
 # --- 1. CONEXIÓN A MONGODB ---
 # Buscamos la URL en las variables de entorno (En Render debes configurar esta variable)
 MONGO_URI = os.getenv("MONGO_URI")
-db_collection = None
+audit_store = None   # Registro de auditoría compacto + rollups (utils/audit.py)
+mongo_writer = None  # Escritura en lotes y en segundo plano (utils/persistence.py)
+shadow_writer = None  # Pares de puntajes campeón/challenger del modo sombra
+
+# Micro-batching de /analyze (MICROBATCH_ENABLED=0 para puntuar de a una)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "1") == "1"
+batcher = None
+
+# Renderizar los gráficos explicativos al arrancar (en segundo plano) en vez de a demanda
+PRECOMPUTE_EXPLANATIONS = os.getenv("PRECOMPUTE_EXPLANATIONS", "0") == "1"
+
+# Hot reload del modelo: watcher del registro (0 = desactivado) y token de administración
+MODEL_WATCH_INTERVAL_S = float(os.getenv("MODEL_WATCH_INTERVAL_S", "0"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+model_watcher = None
+
+# Snapshot periódico de las ventanas de velocidad por cuenta (0 = solo al apagar)
+VELOCITY_SNAPSHOT_INTERVAL_S = float(os.getenv("VELOCITY_SNAPSHOT_INTERVAL_S", "60"))
+velocity_snapshots = None
+# Con varios workers (serve.py) cada proceso tiene su propio snapshot
+velocity_path = ruta_propia(VELOCITY_SNAPSHOT_PATH)
+
+# Datos de entrada recientes para servir /explain/{prediction_id} a posteriori
+explanation_store = ExplanationStore()
 
 @app.on_event("startup")
 def startup_event():
-    global db_collection
+    global audit_store, mongo_writer, shadow_writer, model_watcher, velocity_snapshots
     
     # A) Cargar Modelo
     try:
@@ -49,18 +101,108 @@ def startup_event():
     except Exception as e:
         logger.error(f"❌ Error cargando modelo: {e}")
 
+    if PRECOMPUTE_EXPLANATIONS:
+        threading.Thread(target=explainability.precompute_charts, daemon=True).start()
+
     # B) Conectar a Base de Datos
     if MONGO_URI:
         try:
-            client = MongoClient(MONGO_URI)
+            client = create_client(MONGO_URI)
             db = client.get_database("FraudGuardDB") # Nombre de tu Base de Datos
-            db_collection = db.get_collection("transacciones") # Nombre de tu Colección
+            audit_store = AuditStore(db)
+            try:
+                audit_store.ensure_indexes()
+            except Exception as e:
+                # Se reintenta con el primer lote escrito; mientras tanto todo va al spool
+                logger.warning(f"⚠️ No se pudieron crear los índices de auditoría, se reintentará: {e}")
+            mongo_writer = MongoWriter(audit_store.records, after_insert=audit_store.apply_rollups,
+                                       spool_path=ruta_propia(MONGO_SPOOL_PATH))
+            mongo_writer.adopt(reclamar_huerfanos(MONGO_SPOOL_PATH))
+            mongo_writer.start()
             logger.info("✅ Conexión a MongoDB exitosa.")
         except Exception as e:
             logger.error(f"⚠️ Error conectando a MongoDB: {e}")
     else:
         logger.warning("⚠️ No se encontró MONGO_URI. Los datos NO se guardarán.")
 
+    # C) Watcher de nuevas versiones en el registro
+    if MODEL_WATCH_INTERVAL_S > 0:
+        model_watcher = ModelWatcher(_reload_from_watcher, MODEL_WATCH_INTERVAL_S)
+        model_watcher.start()
+
+    # D) Ventanas de velocidad de la ejecución anterior
+    _restaurar_velocidad()
+    if VELOCITY_SNAPSHOT_INTERVAL_S > 0:
+        velocity_snapshots = SnapshotWriter(inference.VELOCITY_STORE, VELOCITY_SNAPSHOT_INTERVAL_S,
+                                            path=velocity_path)
+        velocity_snapshots.start()
+
+    # E) Challenger en modo sombra (SHADOW_SAMPLE_RATE > 0)
+    on_result = None
+    if audit_store is not None and shadow.SHADOW_SAMPLE_RATE > 0:
+        shadow_spool = os.path.splitext(MONGO_SPOOL_PATH)[0] + "_shadow.jsonl"
+        shadow_writer = MongoWriter(audit_store.shadow, spool_path=ruta_propia(shadow_spool))
+        shadow_writer.adopt(reclamar_huerfanos(shadow_spool))
+        shadow_writer.start()
+        on_result = shadow_writer.write
+    try:
+        inference.SHADOW_SCORER = shadow.start_shadow(on_result=on_result)
+    except Exception as e:
+        logger.error(f"⚠️ Modo sombra desactivado: {e}")
+
+def _restaurar_velocidad():
+    # Snapshot propio y los que dejaron workers de una ejecución anterior
+    try:
+        inference.VELOCITY_STORE.restore(velocity_path)
+        adoptados = []
+        for path in reclamar_huerfanos(VELOCITY_SNAPSHOT_PATH):
+            inference.VELOCITY_STORE.restore(path)
+            adoptados.append(path)
+        if adoptados:
+            inference.VELOCITY_STORE.snapshot(velocity_path)
+            for path in adoptados:
+                os.remove(path)
+    except Exception as e:
+        logger.error(f"⚠️ No se pudo restaurar el snapshot de velocidad: {e}")
+
+def _reload_from_watcher(version):
+    try:
+        inference.reload_model(version)
+    except Exception as e:
+        logger.error(f"❌ Recarga automática de {version} rechazada: {e}")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if model_watcher is not None:
+        model_watcher.stop()
+
+    if velocity_snapshots is not None:
+        velocity_snapshots.stop()
+    if len(inference.VELOCITY_STORE):
+        inference.VELOCITY_STORE.snapshot(velocity_path)
+
+    if inference.SHADOW_SCORER is not None:
+        inference.SHADOW_SCORER.stop()
+
+    # Vacía la cola pendiente hacia Mongo (o al spool si no responde)
+    if mongo_writer is not None:
+        mongo_writer.stop()
+    if shadow_writer is not None:
+        shadow_writer.stop()
+
+@app.on_event("startup")
+async def start_batcher():
+    global batcher
+
+    if MICROBATCH_ENABLED:
+        batcher = MicroBatcher(inference.predict_batch)
+        await batcher.start()
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher is not None:
+        await batcher.stop()
+
 # --- RUTA PRINCIPAL ---
 @app.get("/")
 def read_root():
@@ -68,29 +210,67 @@ def read_root():
         return FileResponse("index.html")
     return {"message": "Frontend no encontrado"}
 
+# Respuesta binaria compacta si el cliente la pide con "Accept: application/msgpack"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+def _acepta_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+def _respuesta_msgpack(payload):
+    import msgpack
+
+    # En binario el PNG viaja como bytes crudos: un 25% menos que en base64
+    if payload.get("shap_image_base64"):
+        payload = dict(payload, shap_image_base64=None,
+                       shap_image_png=base64.b64decode(payload["shap_image_base64"]))
+    return Response(msgpack.packb(payload), media_type="application/msgpack")
+
+def _to_input_dict(data: schemas.TransactionRequest) -> dict:
+    # Extraer .value de los Enums para obtener strings planos
+    return {
+        "amount": data.amount,
+        "hour": data.hour,
+        "account_age": data.account_age,
+        "transaction_type": data.transaction_type.value,
+        "customer_segment": data.customer_segment.value,
+        "account_id": data.account_id
+    }
+
 # ================================
 # ENDPOINT PRINCIPAL
 # ================================
 @app.post("/analyze", response_model=schemas.PredictionResponse)
-async def analyze(data: schemas.TransactionRequest):
+async def analyze(data: schemas.TransactionRequest, request: Request):
+    metrics.mark_validation()
     try:
-        # Extraer .value de los Enums para obtener strings planos
-        input_dict = {
-            "amount": data.amount,
-            "hour": data.hour,
-            "account_age": data.account_age,
-            "transaction_type": data.transaction_type.value,
-            "customer_segment": data.customer_segment.value
-        }
+        input_dict = _to_input_dict(data)
+
+        # 🔥 1. Predicción (agrupada con otras peticiones concurrentes)
+        if batcher is not None:
+            prediction = await batcher.submit(input_dict)
+            metrics.add_timings(prediction.get("stage_timings"))
+        else:
+            prediction = await run_in_threadpool(inference.predict, input_dict)
+        metrics.PREDICTIONS.inc("analyze", prediction.get("risk_level", "LOW"))
 
-        # 🔥 1. Predicción
-        prediction = inference.predict(input_dict)
+        prediction_id = uuid.uuid4().hex
+        explanation_store.put(prediction_id, input_dict)
 
-        # 🔥 2. SHAP
-        shap_img, shap_text = explainability.generate_explanation(input_dict)
+        # 🔥 2. SHAP (caché o pool de render, nunca en el event loop)
+        shap_img, shap_text, shap_svg, contributions = None, None, None, None
+        if data.explain == schemas.ExplainMode.IMAGE:
+            shap_img, shap_text = await explainability.generate_explanation_async(input_dict)
+        elif data.explain == schemas.ExplainMode.TEXT:
+            shap_text = explainability.generate_explanation_text(input_dict)
+        elif data.explain == schemas.ExplainMode.SVG:
+            shap_svg, shap_text = explainability.generate_explanation_svg(input_dict)
+        elif data.explain == schemas.ExplainMode.CONTRIBUTIONS:
+            contributions, shap_text = explainability.generate_explanation_contributions(input_dict)
 
         # 🔥 3. Construir respuesta alineada al schema
         response = {
+            "prediction_id": prediction_id,
             "probability_percent": prediction["probability_percent"],
             "is_fraud": prediction["is_fraud"],
             "risk_score_input": prediction["risk_score_input"],
@@ -98,23 +278,24 @@ async def analyze(data: schemas.TransactionRequest):
             "shap_image_base64": shap_img,
             "ai_explanation": shap_text,
             "risk_level": prediction.get("risk_level", "LOW"),
-            "threshold_used": prediction.get("threshold_used", 0.329)
+            "threshold_used": prediction.get("threshold_used", 0.329),
+            "model_version": prediction.get("model_version"),
+            "velocity": prediction.get("velocity"),
+            "decided_by": prediction.get("decided_by"),
+            "shap_svg": shap_svg,
+            "contributions": contributions
         }
 
-        # 🔥 4. Guardar en Mongo si existe
-        if db_collection is not None:
-            try:
-                db_collection.insert_one({
-                    **input_dict,
-                    **response,
-                    "timestamp": datetime.utcnow()
-                })
-            except Exception as mongo_error:
-                logger.error(f"Error guardando en MongoDB: {mongo_error}")
+        # 🔥 4. Encolar la auditoría para Mongo (se escribe en lotes fuera del request)
+        if mongo_writer is not None:
+            mongo_writer.write(registro_auditoria(input_dict, response, prediction_id, "analyze", datetime.utcnow()))
 
+        if _acepta_msgpack(request):
+            return _respuesta_msgpack(response)
         return response
 
     except Exception as e:
+        metrics.ERRORS.inc("analyze")
         logger.error(f"Error en endpoint /analyze: {e}")
 
         return {
@@ -124,4 +305,207 @@ async def analyze(data: schemas.TransactionRequest):
             "alert_messages": ["Error generando análisis."],
             "shap_image_base64": None,
             "ai_explanation": "Error interno del sistema."
-        }
\ No newline at end of file
+        }
+
+# ================================
+# EXPLICACIÓN DIFERIDA
+# ================================
+@app.get("/explain/{prediction_id}", response_model=schemas.ExplanationResponse)
+async def explain(prediction_id: str):
+    input_dict = explanation_store.get(prediction_id)
+    if input_dict is None:
+        raise HTTPException(status_code=404, detail="Predicción desconocida o expirada.")
+
+    shap_img, shap_text = await explainability.generate_explanation_async(input_dict)
+
+    return {
+        "prediction_id": prediction_id,
+        "shap_image_base64": shap_img,
+        "ai_explanation": shap_text
+    }
+
+# ================================
+# ESTADÍSTICAS DE CACHÉ
+# ================================
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "predictions": inference.get_prediction_cache_stats(),
+        "explanation_charts": explainability.get_cache_stats()
+    }
+
+# ================================
+# TASAS DE FRAUDE (rollups pre-agregados)
+# ================================
+@app.get("/stats/fraud-rate/{dimension}", response_model=schemas.FraudRateResponse)
+def fraud_rate(dimension: schemas.StatsDimension, days: int = Query(7, ge=1, le=366)):
+    if audit_store is None:
+        raise HTTPException(status_code=503, detail="Persistencia no configurada (MONGO_URI).")
+    try:
+        return audit_store.fraud_rate(dimension.value, days)
+    except Exception as e:
+        metrics.ERRORS.inc("mongo_read")
+        logger.error(f"Error consultando rollups: {e}")
+        raise HTTPException(status_code=503, detail="MongoDB no disponible.")
+
+# ================================
+# MÉTRICAS (formato de texto de Prometheus)
+# ================================
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# ================================
+# ENDPOINT POR LOTES
+# ================================
+def _respuesta_sin_grafico(prediction):
+    return {
+        "probability_percent": prediction["probability_percent"],
+        "is_fraud": prediction["is_fraud"],
+        "risk_score_input": prediction["risk_score_input"],
+        "alert_messages": prediction["alert_messages"],
+        "shap_image_base64": None,
+        "ai_explanation": None,
+        "risk_level": prediction.get("risk_level", "LOW"),
+        "threshold_used": prediction.get("threshold_used", 0.329),
+        "model_version": prediction.get("model_version"),
+        "velocity": prediction.get("velocity"),
+        "decided_by": prediction.get("decided_by")
+    }
+
+@app.post("/analyze/batch", response_model=schemas.BatchPredictionResponse)
+def analyze_batch(data: schemas.BatchTransactionRequest, request: Request):
+    # Solo puntajes: el gráfico explicativo se omite para no renderizar miles de imágenes
+    metrics.mark_validation()
+    input_list = [_to_input_dict(item) for item in data.items]
+
+    predictions = inference.predict_batch(input_list)
+    if predictions:
+        metrics.add_timings(predictions[0].get("stage_timings"))
+
+    # Cada resultado lleva su prediction_id: el gráfico se puede pedir luego en /explain/{id}
+    timestamp = datetime.utcnow()
+    results = []
+    for input_dict, prediction in zip(input_list, predictions):
+        prediction_id = uuid.uuid4().hex
+        explanation_store.put(prediction_id, input_dict)
+        result = {"prediction_id": prediction_id, **_respuesta_sin_grafico(prediction)}
+        metrics.PREDICTIONS.inc("analyze_batch", result["risk_level"])
+
+        if mongo_writer is not None:
+            mongo_writer.write(registro_auditoria(input_dict, result, prediction_id, "analyze_batch", timestamp))
+        results.append(result)
+
+    if _acepta_msgpack(request):
+        return _respuesta_msgpack({"count": len(results), "results": results})
+    return {"count": len(results), "results": results}
+
+# ================================
+# STREAMING (WebSocket y NDJSON)
+# ================================
+async def _registros(textos):
+    """Cada texto es un objeto JSON o una lista de objetos -> (seq, TransactionRequest | error)."""
+    seq = 0
+    async for texto in textos:
+        try:
+            payload = json.loads(texto)
+        except ValueError as e:
+            yield seq, f"JSON inválido: {e}"
+            seq += 1
+            continue
+
+        for item in payload if isinstance(payload, list) else [payload]:
+            try:
+                yield seq, schemas.TransactionRequest.model_validate(item)
+            except ValidationError as e:
+                yield seq, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            seq += 1
+
+def _puntuar_flujo(lote):
+    """Corre en un hilo: puntúa un micro-lote del flujo respetando el orden de llegada."""
+    validos = [data for _, data in lote if not isinstance(data, str)]
+    input_list = [_to_input_dict(data) for data in validos]
+    predictions = iter(zip(input_list, inference.predict_batch(input_list)))
+    timestamp = datetime.utcnow()
+
+    resultados = []
+    for seq, data in lote:
+        if isinstance(data, str):
+            metrics.ERRORS.inc("stream_validation")
+            resultados.append({"seq": seq, "error": data})
+            continue
+
+        input_dict, prediction = next(predictions)
+        prediction_id = uuid.uuid4().hex
+        explanation_store.put(prediction_id, input_dict)
+        result = {"seq": seq, "prediction_id": prediction_id, **_respuesta_sin_grafico(prediction)}
+        metrics.PREDICTIONS.inc("analyze_stream", result["risk_level"])
+
+        if mongo_writer is not None:
+            mongo_writer.write(registro_auditoria(input_dict, result, prediction_id, "analyze_stream", timestamp))
+        resultados.append(result)
+
+    return resultados
+
+@app.websocket("/analyze/stream")
+async def analyze_stream_ws(websocket: WebSocket):
+    await websocket.accept()
+
+    async def mensajes():
+        try:
+            while True:
+                yield await websocket.receive_text()
+        except WebSocketDisconnect:
+            return
+
+    try:
+        async for result in streaming.score_stream(_registros(mensajes()), _puntuar_flujo):
+            await websocket.send_text(json.dumps(result))
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/analyze/stream")
+async def analyze_stream_ndjson(request: Request):
+    async def respuesta():
+        textos = streaming.lineas(request.stream())
+        async for result in streaming.score_stream(_registros(textos), _puntuar_flujo):
+            yield json.dumps(result) + "\n"
+
+    return streaming.DuplexStreamingResponse(respuesta(), media_type="application/x-ndjson")
+
+# ================================
+# ADMINISTRACIÓN DEL MODELO
+# ================================
+def _check_admin(token):
+    # Sin ADMIN_TOKEN configurado los endpoints de administración quedan cerrados
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Administración desactivada (ADMIN_TOKEN no configurado).")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Token de administración inválido.")
+
+@app.get("/admin/model")
+def model_info(x_admin_token: str = Header(None)):
+    _check_admin(x_admin_token)
+    return {
+        "model_version": inference.get_model_version(),
+        "available_versions": list_versions(),
+        "lookup_table": inference.get_lookup_info(),
+    }
+
+@app.get("/admin/shadow/stats")
+def shadow_stats(x_admin_token: str = Header(None)):
+    _check_admin(x_admin_token)
+    if inference.SHADOW_SCORER is None:
+        return {"active": False, "sample_rate": shadow.SHADOW_SAMPLE_RATE}
+    return inference.SHADOW_SCORER.snapshot()
+
+@app.post("/admin/model/reload")
+async def model_reload(data: schemas.ModelReloadRequest = None, x_admin_token: str = Header(None)):
+    _check_admin(x_admin_token)
+    version = data.version if data is not None else None
+
+    # Carga, calentamiento y validación en un hilo: /analyze sigue atendiendo con el modelo actual
+    try:
+        return await run_in_threadpool(inference.reload_model, version)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
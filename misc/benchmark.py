@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
+# ==============================================================================
+# 1. Obtener la ruta absoluta de la carpeta donde está este script (misc)
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 2. Obtener la ruta raíz del proyecto (un nivel arriba de misc)
+project_root = os.path.abspath(os.path.join(current_script_dir, '..'))
+
+# 3. Agregar la raíz al 'sys.path' para poder importar 'utils'
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# 4. CAMBIAR EL DIRECTORIO DE TRABAJO A LA RAÍZ
+os.chdir(project_root)
+# ==============================================================================
+
+import numpy as np
+
+# --- BENCHMARK DE LATENCIA Y THROUGHPUT ---
+# 1. Micro-benchmarks por etapa (feature engineering, predict_proba, scorer
+#    compilado, predict / predict_batch, gráfico explicativo).
+# 2. End-to-end en proceso contra la app FastAPI (p50/p95/p99 y req/s).
+# 3. Resultados en JSON; con --baseline se comparan contra una corrida anterior.
+#
+# Uso:
+#   python misc/benchmark.py --output bench_results.json
+#   python misc/benchmark.py --baseline bench_results.json --max-regression 0.2
+
+TIPOS = ["Online Purchase", "ATM Withdrawal", "POS Purchase", "Bank Transfer"]
+SEGMENTOS = ["Retail", "Business", "Corporate"]
+
+# =========================================================
+# CARGA DE TRABAJO SINTÉTICA
+# =========================================================
+def _parse_mix(text, opciones):
+    """'ATM Withdrawal=0.5,Retail=...' -> pesos normalizados sobre `opciones`."""
+    if not text:
+        return [1.0 / len(opciones)] * len(opciones)
+    pesos = dict.fromkeys(opciones, 0.0)
+    for parte in text.split(","):
+        nombre, _, peso = parte.partition("=")
+        if nombre.strip() not in pesos:
+            raise ValueError(f"Opción desconocida: {nombre.strip()} (válidas: {opciones})")
+        pesos[nombre.strip()] = float(peso)
+    total = sum(pesos.values())
+    return [pesos[o] / total for o in opciones]
+
+def generar_carga(n, seed=42, type_mix=None, segment_mix=None, night_share=0.2,
+                  amount_median=250.0, amount_sigma=1.5, max_account_age=30.0):
+    """
+    Transacciones con el formato de TransactionRequest.
+    Montos log-normales; `night_share` es la fracción en horario de madrugada.
+    """
+    rng = random.Random(seed)
+    tipos_w = _parse_mix(type_mix, TIPOS)
+    segmentos_w = _parse_mix(segment_mix, SEGMENTOS)
+    horas_noche = [23, 0, 1, 2, 3, 4, 5]
+    horas_dia = [h for h in range(24) if h not in horas_noche]
+
+    carga = []
+    for _ in range(n):
+        hora = rng.choice(horas_noche if rng.random() < night_share else horas_dia)
+        carga.append({
+            "amount": round(max(0.01, rng.lognormvariate(np.log(amount_median), amount_sigma)), 2),
+            "hour": hora,
+            "account_age": round(rng.uniform(0, max_account_age), 1),
+            "transaction_type": rng.choices(TIPOS, tipos_w)[0],
+            "customer_segment": rng.choices(SEGMENTOS, segmentos_w)[0],
+        })
+    return carga
+
+# =========================================================
+# MEDICIÓN
+# =========================================================
+def _resumen(latencias_s):
+    ms = np.asarray(latencias_s) * 1000
+    return {
+        "n": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+    }
+
+def _medir(fn, argumentos, repeticiones=1):
+    """Llama fn(arg) para cada argumento y devuelve el resumen de latencias."""
+    latencias = []
+    for _ in range(repeticiones):
+        for arg in argumentos:
+            inicio = time.perf_counter()
+            fn(arg)
+            latencias.append(time.perf_counter() - inicio)
+    return _resumen(latencias)
+
+def benchmark_etapas(carga, batch_size):
+    import pandas as pd
+    import utils.inference as inference
+    import utils.explainability as explainability
+
+    modelo = inference._modelo_activo()
+    filas = carga[:200]
+    lotes = [carga[i:i + batch_size] for i in range(0, len(carga), batch_size)][:20]
+    resultados = {}
+
+    resultados["feature_engineering_1"] = _medir(
+        lambda r: inference.aplicar_feature_engineering_api(pd.DataFrame([r])), filas)
+    resultados[f"feature_engineering_{batch_size}"] = _medir(
+        lambda b: inference.aplicar_feature_engineering_api(pd.DataFrame(b)), lotes)
+
+    if modelo.pipeline is not None:
+        procesadas = [inference.aplicar_feature_engineering_api(pd.DataFrame([r])) for r in filas]
+        resultados["pipeline_predict_proba_1"] = _medir(modelo.pipeline.predict_proba, procesadas)
+        procesadas = [inference.aplicar_feature_engineering_api(pd.DataFrame(b)) for b in lotes]
+        resultados[f"pipeline_predict_proba_{batch_size}"] = _medir(modelo.pipeline.predict_proba, procesadas)
+
+    if modelo.compiled is not None:
+        resultados["compiled_predict_1"] = _medir(modelo.compiled.predict_proba_one, filas)
+        resultados[f"compiled_predict_{batch_size}"] = _medir(modelo.compiled.predict_proba_records, lotes)
+
+    # Sin caché: _score evalúa el modelo siempre
+    resultados["score_uncached_1"] = _medir(lambda r: inference._score([r], modelo), filas)
+    # Caché vacía antes de cada etapa: predict_1 ya deja cacheadas filas que también están en los lotes
+    inference._PREDICTION_CACHE.clear()
+    resultados["predict_1"] = _medir(inference.predict, filas)
+    inference._PREDICTION_CACHE.clear()
+    resultados[f"predict_batch_{batch_size}"] = _medir(inference.predict_batch, lotes)
+
+    contribuciones = explainability.calcular_contribuciones((2, 2, 2, 1))
+    resultados["chart_render_uncached"] = _medir(explainability._render_chart, [contribuciones] * 10)
+    resultados["generate_explanation"] = _medir(explainability.generate_explanation, filas)
+
+    return resultados
+
+async def _end_to_end(carga, concurrencia, explain):
+    import httpx
+    import app
+
+    latencias = []
+    errores = 0
+    cola = asyncio.Queue()
+    for item in carga:
+        cola.put_nowait(dict(item, explain=explain))
+
+    async with app.app.router.lifespan_context(app.app):
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def worker():
+                nonlocal errores
+                while not cola.empty():
+                    item = cola.get_nowait()
+                    inicio = time.perf_counter()
+                    respuesta = await client.post("/analyze", json=item)
+                    latencias.append(time.perf_counter() - inicio)
+                    if respuesta.status_code != 200:
+                        errores += 1
+
+            inicio = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(concurrencia)])
+            duracion = time.perf_counter() - inicio
+
+    resumen = _resumen(latencias)
+    resumen.update({
+        "concurrency": concurrencia,
+        "explain": explain,
+        "errors": errores,
+        "duration_s": round(duracion, 3),
+        "requests_per_s": round(len(latencias) / duracion, 2),
+    })
+    return resumen
+
+def benchmark_end_to_end(carga, concurrencia, modos):
+    return {
+        f"analyze_explain_{modo}": asyncio.run(_end_to_end(carga, concurrencia, modo))
+        for modo in modos
+    }
+
+# =========================================================
+# COMPARACIÓN CONTRA UNA CORRIDA ANTERIOR
+# =========================================================
+def comparar(actual, baseline, metrica="p50_ms"):
+    """Cambio relativo de `metrica` por etapa (positivo = más lento)."""
+    cambios = {}
+    for seccion in ("stages", "end_to_end"):
+        for nombre, valores in actual.get(seccion, {}).items():
+            previo = baseline.get(seccion, {}).get(nombre)
+            if previo and previo.get(metrica):
+                cambios[f"{seccion}.{nombre}"] = round(valores[metrica] / previo[metrica] - 1, 4)
+    return cambios
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia/throughput de FraudGuard.")
+    parser.add_argument("--requests", type=int, default=1000, help="Transacciones sintéticas a generar.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--type-mix", default=None, help="Ej: 'ATM Withdrawal=0.5,Online Purchase=0.5'")
+    parser.add_argument("--segment-mix", default=None, help="Ej: 'Retail=0.7,Business=0.2,Corporate=0.1'")
+    parser.add_argument("--night-share", type=float, default=0.2, help="Fracción de transacciones de madrugada.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--explain", default="none,image", help="Modos de /analyze a medir end-to-end.")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior para comparar.")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Falla (exit 1) si alguna p50 empeora más que esta fracción vs --baseline.")
+    args = parser.parse_args()
+
+    # Nunca escribir en la base real durante un benchmark (vacía y no borrada:
+    # load_dotenv de app.py no pisa una variable que ya existe)
+    os.environ["MONGO_URI"] = ""
+
+    import logging
+    logging.disable(logging.INFO)
+
+    import utils.inference as inference
+    inference.load_model_assets()
+
+    carga = generar_carga(args.requests, seed=args.seed, type_mix=args.type_mix,
+                          segment_mix=args.segment_mix, night_share=args.night_share)
+
+    resultados = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model_version": inference.get_model_version(),
+            "config": vars(args),
+        },
+    }
+
+    if not args.skip_stages:
+        print("⏱️  Micro-benchmarks por etapa...")
+        resultados["stages"] = benchmark_etapas(carga, args.batch_size)
+        for nombre, r in resultados["stages"].items():
+            print(f"   {nombre:<32} p50 {r['p50_ms']:>10.3f} ms   p99 {r['p99_ms']:>10.3f} ms")
+
+    if not args.skip_e2e:
+        print(f"🌐 End-to-end en proceso ({args.requests} req, concurrencia {args.concurrency})...")
+        resultados["end_to_end"] = benchmark_end_to_end(carga, args.concurrency, args.explain.split(","))
+        for nombre, r in resultados["end_to_end"].items():
+            print(f"   {nombre:<32} p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                  f"p99 {r['p99_ms']:>8.2f} ms  {r['requests_per_s']:>8.1f} req/s  errores {r['errors']}")
+
+    regresiones = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            cambios = comparar(resultados, json.load(f))
+        resultados["comparison_vs_baseline"] = cambios
+        print(f"📊 Cambio de p50 vs {args.baseline}:")
+        for nombre, cambio in cambios.items():
+            print(f"   {nombre:<45} {cambio:+.1%}")
+        if args.max_regression is not None:
+            regresiones = {k: v for k, v in cambios.items() if v > args.max_regression}
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"💾 Resultados guardados en {args.output}")
+
+    if regresiones:
+        print(f"❌ Regresiones por encima de {args.max_regression:.0%}: {regresiones}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
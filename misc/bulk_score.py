@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
+# ==============================================================================
+# 1. Obtener la ruta absoluta de la carpeta donde está este script (misc)
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 2. Obtener la ruta raíz del proyecto (un nivel arriba de misc)
+project_root = os.path.abspath(os.path.join(current_script_dir, '..'))
+
+# 3. Agregar la raíz al 'sys.path' para poder importar 'utils'
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+# --- SCORING MASIVO OFFLINE ---
+# Re-puntúa archivos históricos (CSV, JSONL o Parquet) sin pasar por HTTP:
+# 1. Lee el archivo en bloques de --chunk-size filas (memoria constante).
+# 2. Cada bloque se puntúa con una sola pasada vectorizada en un pool de procesos.
+# 3. Los resultados se agregan al archivo de salida en orden, bloque a bloque.
+# 4. Tras cada bloque se guarda un checkpoint; con --resume se retoma desde ahí.
+#
+# Uso:
+#   python misc/bulk_score.py transacciones.jsonl --output scored.jsonl
+#   python misc/bulk_score.py historico.csv --output scored.csv --workers 4 --resume
+#
+# Las rutas relativas se resuelven contra el directorio desde donde se ejecuta.
+
+REQUIRED_COLUMNS = ["amount", "hour", "account_age", "transaction_type", "customer_segment"]
+FORMATOS = {".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+
+# =========================================================
+# LECTURA POR BLOQUES
+# =========================================================
+def detectar_formato(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {path} (usa .csv, .jsonl o .parquet)")
+    return FORMATOS[extension]
+
+def leer_bloques(path, formato, chunk_size):
+    """Generador de DataFrames de hasta `chunk_size` filas."""
+    import pandas as pd
+
+    if formato == "csv":
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    elif formato == "jsonl":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size)
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+
+# =========================================================
+# PUNTUACIÓN (en cada proceso del pool)
+# =========================================================
+def _init_worker(version):
+    import logging
+    logging.disable(logging.INFO)
+
+    os.chdir(project_root)
+    import utils.inference as inference
+    inference.load_model_assets(version)
+
+    # Un hilo por proceso: el paralelismo lo da el pool, no el bosque
+    modelo = inference._modelo_activo()
+    if modelo.pipeline is not None:
+        modelo.pipeline.steps[-1][1].set_params(n_jobs=1)
+
+def puntuar_bloque(df):
+    """Agrega probability_percent, risk_level, action, is_fraud y model_version al bloque."""
+    import numpy as np
+    import utils.inference as inference
+
+    faltantes = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas obligatorias: {faltantes}")
+
+    # Filas incompletas no se puntúan: quedan con risk_level "ERROR"
+    validas = df[REQUIRED_COLUMNS].notna().all(axis=1).to_numpy()
+    probs = np.full(len(df), np.nan)
+    if validas.any():
+        probs[validas] = inference.predict_frame(df.loc[validas, REQUIRED_COLUMNS])
+
+    niveles, acciones = inference.clasificar_riesgo(np.nan_to_num(probs))
+    niveles = np.where(validas, niveles, "ERROR")
+    acciones = np.where(validas, acciones, None)
+
+    return df.assign(
+        probability_percent=np.round(probs * 100, 2),
+        risk_level=niveles,
+        action=acciones,
+        is_fraud=acciones == "BLOCK",
+        model_version=inference.get_model_version(),
+    )
+
+# =========================================================
+# ESCRITURA INCREMENTAL Y CHECKPOINT
+# =========================================================
+def escribir_bloque(f, df, formato, con_encabezado):
+    if formato == "csv":
+        df.to_csv(f, index=False, header=con_encabezado)
+    else:
+        texto = df.to_json(orient="records", lines=True, date_format="iso", default_handler=str)
+        f.write(texto if texto.endswith("\n") else texto + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+def leer_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def guardar_checkpoint(path, estado):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(estado, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _bloques_puntuados(bloques, workers, version):
+    """Puntúa en orden; con más de un worker mantiene a lo sumo 2 bloques por proceso en vuelo."""
+    if workers <= 1:
+        _init_worker(version)
+        for indice, df in bloques:
+            yield indice, puntuar_bloque(df)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(version,)) as pool:
+        en_vuelo = []
+        for indice, df in bloques:
+            en_vuelo.append((indice, pool.submit(puntuar_bloque, df)))
+            if len(en_vuelo) >= 2 * workers:
+                indice_listo, futuro = en_vuelo.pop(0)
+                yield indice_listo, futuro.result()
+        for indice_listo, futuro in en_vuelo:
+            yield indice_listo, futuro.result()
+
+# =========================================================
+# MAIN
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(description="Scoring masivo offline de transacciones.")
+    parser.add_argument("input", help="Archivo .csv, .jsonl o .parquet")
+    parser.add_argument("--output", required=True, help="Archivo de salida .csv o .jsonl")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--version", default=None, help="Versión del registro (por defecto, la más reciente).")
+    parser.add_argument("--resume", action="store_true", help="Retoma desde el checkpoint de --output.")
+    args = parser.parse_args()
+
+    formato_entrada = detectar_formato(args.input)
+    formato_salida = detectar_formato(args.output)
+    if formato_salida == "parquet":
+        raise SystemExit("❌ La salida debe ser .csv o .jsonl (se escribe por anexado y permite retomar).")
+
+    input_path = os.path.abspath(args.input)
+    output_path = os.path.abspath(args.output)
+    checkpoint_path = output_path + ".ckpt"
+
+    # La versión se fija una sola vez: todos los procesos puntúan con el mismo modelo
+    os.chdir(project_root)
+    import utils.registry as registry
+    import utils.inference as inference
+    version_registro = args.version or registry.latest_version()
+    model_version = inference._resolver_artefacto(version_registro)[1]
+
+    estado = leer_checkpoint(checkpoint_path) if args.resume else None
+    if estado is not None:
+        if estado["input"] != input_path or estado["chunk_size"] != args.chunk_size:
+            raise SystemExit("❌ El checkpoint corresponde a otra entrada o a otro --chunk-size.")
+        if estado["model_version"] != model_version:
+            raise SystemExit(f"❌ El checkpoint se hizo con el modelo {estado['model_version']}; "
+                             f"usa --version {estado['model_version']}.")
+        print(f"⏩ Retomando desde el bloque {estado['chunks_done']} ({estado['rows_done']} filas).")
+    else:
+        estado = {
+            "input": input_path,
+            "chunk_size": args.chunk_size,
+            "model_version": model_version,
+            "chunks_done": 0,
+            "rows_done": 0,
+            "output_bytes": 0,
+        }
+
+    # Se descarta lo escrito después del último checkpoint (bloque a medio escribir)
+    modo = "r+b" if estado["output_bytes"] and os.path.exists(output_path) else "wb"
+    with open(output_path, modo) as f:
+        f.truncate(estado["output_bytes"])
+
+    bloques = (
+        (indice, df)
+        for indice, df in enumerate(leer_bloques(input_path, formato_entrada, args.chunk_size))
+        if indice >= estado["chunks_done"]
+    )
+
+    inicio = time.perf_counter()
+    filas = 0
+    with open(output_path, "a", encoding="utf-8", newline="") as f:
+        for indice, df in _bloques_puntuados(bloques, args.workers, version_registro):
+            escribir_bloque(f, df, formato_salida, con_encabezado=estado["output_bytes"] == 0)
+            filas += len(df)
+            estado.update(
+                chunks_done=indice + 1,
+                rows_done=estado["rows_done"] + len(df),
+                output_bytes=f.tell(),
+            )
+            guardar_checkpoint(checkpoint_path, estado)
+
+            duracion = time.perf_counter() - inicio
+            print(f"   bloque {indice:>5}  {estado['rows_done']:>12,} filas  {filas / duracion:>10,.0f} filas/s")
+
+    print(f"✅ {estado['rows_done']:,} filas puntuadas con {model_version} -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+from datetime import datetime, timedelta
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
+# ==============================================================================
+# 1. Obtener la ruta absoluta de la carpeta donde está este script (misc)
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 2. Obtener la ruta raíz del proyecto (un nivel arriba de misc)
+project_root = os.path.abspath(os.path.join(current_script_dir, '..'))
+
+# 3. Agregar la raíz al 'sys.path' para poder importar 'utils'
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+# --- PRUEBA DEL REGISTRO DE AUDITORÍA CONTRA UN MONGOD ---
+# Escribe transacciones sintéticas con el mismo camino que la API
+# (MongoWriter + AuditStore), compara los rollups con una agregación completa
+# del registro y mide las consultas de /stats/fraud-rate/*. Usa una base
+# temporal que se borra al terminar (salvo --keep).
+#
+# Uso:
+#   docker run -d -p 27017:27017 mongo:7
+#   python misc/check_audit.py --uri mongodb://localhost:27017 --requests 20000
+
+def generar_registros(n, dias, seed):
+    from benchmark import generar_carga
+    from utils.audit import registro_auditoria
+    import utils.inference as inference
+
+    carga = generar_carga(n, seed=seed)
+    resultados = inference.predict_batch(carga)
+
+    ahora = datetime.utcnow()
+    registros = []
+    for i, (input_dict, result) in enumerate(zip(carga, resultados)):
+        timestamp = ahora - timedelta(days=i % dias, seconds=i)
+        registros.append(registro_auditoria(input_dict, result, uuid.uuid4().hex, "check_audit", timestamp))
+    return registros
+
+def agregacion_completa(store, dimension, desde):
+    """Tasas calculadas recorriendo el registro (lo que los rollups evitan)."""
+    from utils.audit import DIMENSIONES
+
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": datetime.strptime(desde, "%Y-%m-%d")}}},
+        {"$group": {
+            "_id": {"$toString": f"$input.{DIMENSIONES[dimension]}"},
+            "total": {"$sum": 1},
+            "blocked": {"$sum": {"$cond": ["$is_fraud", 1, 0]}},
+        }},
+    ]
+    return {fila["_id"]: (fila["total"], fila["blocked"]) for fila in store.records.aggregate(pipeline)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba del registro de auditoría contra un mongod.")
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default=f"FraudGuardCheck_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=7, help="Días sobre los que se reparten las transacciones.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="No borrar la base al terminar.")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    os.chdir(project_root)
+    from utils.audit import AuditStore, DIMENSIONES
+    from utils.persistence import MongoWriter, create_client
+
+    client = create_client(args.uri)
+    client.admin.command("ping")
+    db = client.get_database(args.database)
+    store = AuditStore(db)
+    store.ensure_indexes()
+
+    try:
+        registros = generar_registros(args.requests, args.days, args.seed)
+
+        inicio = time.perf_counter()
+        writer = MongoWriter(store.records, after_insert=store.apply_rollups,
+                             spool_path=os.path.join(project_root, "check_audit_spool.jsonl"))
+        writer.start()
+        for registro in registros:
+            writer.write(registro)
+        writer.stop()
+        duracion = time.perf_counter() - inicio
+        print(f"📝 {store.records.count_documents({}):,} registros escritos en {duracion:.2f}s "
+              f"(spool: {writer.stats['spooled']})")
+
+        errores = 0
+        for dimension in DIMENSIONES:
+            inicio = time.perf_counter()
+            resultado = store.fraud_rate(dimension, args.days)
+            rollup_ms = (time.perf_counter() - inicio) * 1000
+
+            inicio = time.perf_counter()
+            esperado = agregacion_completa(store, dimension, resultado["since"])
+            scan_ms = (time.perf_counter() - inicio) * 1000
+
+            obtenido = {b["key"]: (b["total"], b["blocked"]) for b in resultado["buckets"]}
+            ok = obtenido == esperado
+            errores += not ok
+            print(f"   {'✅' if ok else '❌'} {dimension:<8} {len(obtenido):>3} valores  "
+                  f"rollups {rollup_ms:7.2f} ms  vs agregación completa {scan_ms:8.2f} ms")
+    finally:
+        if not args.keep:
+            client.drop_database(args.database)
+
+    if errores:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
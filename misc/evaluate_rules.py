@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import argparse
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
+# ==============================================================================
+# 1. Obtener la ruta absoluta de la carpeta donde está este script (misc)
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 2. Obtener la ruta raíz del proyecto (un nivel arriba de misc)
+project_root = os.path.abspath(os.path.join(current_script_dir, '..'))
+
+# 3. Agregar la raíz al 'sys.path' para poder importar 'utils'
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+
+# --- EVALUACIÓN OFFLINE DEL PRE-FILTRO DE REGLAS ---
+# Compara la decisión de cada regla con la del modelo (predict_proba + umbrales)
+# sobre datos de muestra: cobertura, acuerdo y bloqueos que la regla dejaría pasar.
+#
+# Uso:
+#   python misc/evaluate_rules.py --rules rules.example.json
+#   python misc/evaluate_rules.py --rules rules.json --input historico.csv --min-agreement 0.99
+
+def cargar_muestra(args):
+    if args.input:
+        from bulk_score import detectar_formato, leer_bloques
+        path = os.path.abspath(args.input)
+        return pd.concat(leer_bloques(path, detectar_formato(path), 100000), ignore_index=True)
+
+    from benchmark import generar_carga
+    return pd.DataFrame(generar_carga(args.requests, seed=args.seed, max_account_age=args.max_account_age))
+
+def evaluar(tabla, df, inference):
+    """Resumen por regla y global del acuerdo entre el pre-filtro y el modelo."""
+    probs = np.concatenate([
+        inference.predict_frame(df.iloc[i:i + 50000]) for i in range(0, len(df), 50000)
+    ])
+    _, acciones_modelo = inference.clasificar_riesgo(probs)
+
+    registros = df[["amount", "hour", "account_age", "transaction_type", "customer_segment"]].to_dict("records")
+    decisiones = [tabla.decide(r) for r in registros]
+
+    por_regla = {}
+    for regla in tabla.reglas:
+        nombre = regla["name"]
+        mascara = np.array([d is not None and d[1] == nombre for d in decisiones])
+        n = int(mascara.sum())
+        resumen = {"decision": regla["decision"], "matched": n, "coverage": round(n / len(df), 4)}
+        if n:
+            acciones = acciones_modelo[mascara]
+            resumen.update({
+                "agreement": round(float(np.mean(acciones == regla["decision"])), 4),
+                "model_actions": {a: int(np.sum(acciones == a)) for a in ("APPROVE", "REVIEW", "BLOCK")},
+                "prob_min": round(float(probs[mascara].min()), 4),
+                "prob_max": round(float(probs[mascara].max()), 4),
+            })
+            if regla["decision"] == "APPROVE":
+                # Lo grave de aprobar por regla: transacciones que el modelo bloquearía
+                resumen["missed_blocks"] = int(np.sum(acciones == "BLOCK"))
+        por_regla[nombre] = resumen
+
+    decididas = np.array([d is not None for d in decisiones])
+    coincidencias = sum(por_regla[n].get("agreement", 0) * por_regla[n]["matched"] for n in por_regla)
+    return {
+        "samples": len(df),
+        "coverage": round(float(decididas.mean()), 4),
+        "agreement": round(coincidencias / decididas.sum(), 4) if decididas.any() else None,
+        "rules": por_regla,
+    }
+
+def main():
+    from utils.rules import RULES_PATH, RuleTable, load_rules
+
+    parser = argparse.ArgumentParser(description="Acuerdo del pre-filtro de reglas con el modelo.")
+    parser.add_argument("--rules", default=RULES_PATH or "rules.example.json")
+    parser.add_argument("--input", default=None, help="Datos reales (.csv, .jsonl, .parquet); si no, sintéticos.")
+    parser.add_argument("--requests", type=int, default=100000, help="Transacciones sintéticas sin --input.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-account-age", type=float, default=30.0)
+    parser.add_argument("--version", default=None, help="Versión del registro (por defecto, la más reciente).")
+    parser.add_argument("--min-agreement", type=float, default=None,
+                        help="Falla (exit 1) si alguna regla acuerda con el modelo menos que esto.")
+    parser.add_argument("--output", default=None, help="Guarda el resumen en JSON.")
+    args = parser.parse_args()
+
+    rules_path = os.path.abspath(args.rules)
+    df = cargar_muestra(args)
+
+    import logging
+    logging.disable(logging.INFO)
+    os.chdir(project_root)
+    import utils.inference as inference
+    inference.load_model_assets(args.version)
+
+    tabla = RuleTable(load_rules(rules_path))
+    resultado = evaluar(tabla, df, inference)
+    resultado["model_version"] = inference.get_model_version()
+
+    print(f"📏 {len(tabla.reglas)} reglas ({len(tabla)} celdas) vs modelo {resultado['model_version']} "
+          f"sobre {resultado['samples']:,} transacciones")
+    for nombre, r in resultado["rules"].items():
+        detalle = ""
+        if r["matched"]:
+            detalle = (f"acuerdo {r['agreement']:>7.2%}  prob [{r['prob_min']:.3f}, {r['prob_max']:.3f}]  "
+                       f"modelo {r['model_actions']}")
+        print(f"   {nombre:<30} {r['decision']:<8} cobertura {r['coverage']:>7.2%}  {detalle}")
+    if resultado["agreement"] is not None:
+        print(f"   {'TOTAL':<30} {'':<8} cobertura {resultado['coverage']:>7.2%}  acuerdo {resultado['agreement']:>7.2%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resumen guardado en {args.output}")
+
+    if args.min_agreement is not None:
+        bajas = [n for n, r in resultado["rules"].items() if r["matched"] and r["agreement"] < args.min_agreement]
+        if bajas:
+            print(f"❌ Reglas por debajo de {args.min_agreement:.0%} de acuerdo: {bajas}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
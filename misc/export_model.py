@@ -0,0 +1,47 @@
+import os
+import sys
+import argparse
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
+# ==============================================================================
+# 1. Obtener la ruta absoluta de la carpeta donde está este script (misc)
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 2. Obtener la ruta raíz del proyecto (un nivel arriba de misc)
+project_root = os.path.abspath(os.path.join(current_script_dir, '..'))
+
+# 3. Agregar la raíz al 'sys.path' para poder importar 'utils'
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# 4. CAMBIAR EL DIRECTORIO DE TRABAJO A LA RAÍZ
+os.chdir(project_root)
+# ==============================================================================
+
+import utils.inference as inference
+
+# --- EXPORTADOR DE MODELO COMPILADO ---
+# Convierte el Pipeline (.pkl) en arrays NumPy (.npy + meta.json) que la API
+# mapea en memoria al arrancar con COMPILED_MODEL_DIR=<carpeta>.
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el modelo como arrays NumPy mapeables en memoria.")
+    parser.add_argument("--output", default=os.getenv("COMPILED_MODEL_DIR") or "models/compiled",
+                        help="Carpeta de destino (por defecto COMPILED_MODEL_DIR o models/compiled).")
+    parser.add_argument("--version", default=None,
+                        help="Versión del registro a exportar (por defecto la que cargaría la API).")
+    args = parser.parse_args()
+
+    print("--- EXPORTADOR DE MODELO COMPILADO ---")
+    try:
+        version = inference.export_compiled_model(args.output, args.version)
+    except Exception as e:
+        print(f"❌ ERROR: {e}")
+        sys.exit(1)
+
+    print(f"🎉 Modelo {version} exportado a {args.output}")
+    print(f"   Arranque rápido: COMPILED_MODEL_DIR={args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import os
 import sys
 import shutil
+import argparse
+from datetime import datetime
 
 # ==============================================================================
 # BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
@@ -37,7 +39,14 @@ NOMBRE_MODELO = "Fraud_Detector_Production_fix"
 FULL_MODEL_NAME = f"{CATALOGO}.{ESQUEMA}.{NOMBRE_MODELO}"
 
 ALIAS = "Champion"         # La etiqueta que le pusimos al ganador
-OUTPUT_FILE = "fraude.pkl" # Nombre del archivo local
+CHALLENGER_ALIAS = "Challenger"  # Candidato a evaluar en modo sombra antes de promoverlo
+
+# Registro local versionado: la API carga la versión más nueva de esta carpeta
+# (y la detecta en caliente si MODEL_WATCH_INTERVAL_S > 0)
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+# Los challengers van a un registro aparte: el watcher nunca los toma como campeón
+CHALLENGER_DIR = os.getenv("CHALLENGER_DIR", os.path.join(MODELS_DIR, "challenger"))
+VERSION = datetime.now().strftime("v%Y%m%d_%H%M%S")
 
 print("--- ACTUALIZADOR DE MODELO (MODO UNITY CATALOG) ---")
 
@@ -50,7 +59,11 @@ except ImportError:
     print("❌ Faltan librerías. Ejecuta: pip install mlflow pandas python-dotenv joblib")
     sys.exit(1)
 
-def download_champion_model():
+def download_champion_model(alias=ALIAS):
+    es_challenger = alias == CHALLENGER_ALIAS
+    destino = CHALLENGER_DIR if es_challenger else MODELS_DIR
+    output_file = os.path.join(destino, f"{VERSION}.pkl")
+
     # 1. Validar Credenciales
     token = os.environ.get("DATABRICKS_TOKEN")
     host = os.environ.get("DATABRICKS_HOST")
@@ -68,7 +81,7 @@ def download_champion_model():
     try:
         # 3. Construir la URI del Modelo Champion
         # Formato: models:/<catalogo>.<esquema>.<modelo>@<alias>
-        model_uri = f"models:/{FULL_MODEL_NAME}@{ALIAS}"
+        model_uri = f"models:/{FULL_MODEL_NAME}@{alias}"
         
         print(f"🔍 Buscando modelo certificado: {model_uri}")
         print(f"📥 Descargando Pipeline completo... (esto incluye el preprocesador)")
@@ -76,13 +89,21 @@ def download_champion_model():
         # 4. Cargar el Pipeline directamente desde Databricks
         loaded_pipeline = mlflow.sklearn.load_model(model_uri)
         
-        # 5. Guardar en disco local
-        joblib.dump(loaded_pipeline, OUTPUT_FILE)
+        # 5. Guardar en disco local (escritura atómica: el watcher nunca ve un archivo a medias)
+        os.makedirs(destino, exist_ok=True)
+        tmp_file = os.path.join(destino, f".{VERSION}.pkl.tmp")
+        joblib.dump(loaded_pipeline, tmp_file)
+        os.replace(tmp_file, output_file)
         
         print("-" * 50)
-        print(f"🎉 ¡ÉXITO! Se ha descargado la versión '{ALIAS}' de Unity Catalog.")
-        print(f"📂 Archivo guardado: {OUTPUT_FILE}")
+        print(f"🎉 ¡ÉXITO! Se ha descargado la versión '{alias}' de Unity Catalog.")
+        print(f"📂 Archivo guardado: {output_file} (versión {VERSION})")
         print("   (Ahora tu app puede recibir datos crudos, el pipeline los transformará)")
+        if es_challenger:
+            print("   Para evaluarla en sombra: SHADOW_SAMPLE_RATE=0.1 y reiniciar la API;")
+            print("   las estadísticas quedan en GET /admin/shadow/stats")
+        else:
+            print("   Para activarla sin reiniciar: POST /admin/model/reload")
         print("-" * 50)
 
     except Exception as e:
@@ -92,4 +113,8 @@ def download_champion_model():
         print("2. ¿Tu token tiene permisos de lectura sobre ese modelo?")
 
 if __name__ == "__main__":
-    download_champion_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Descarga un modelo de Unity Catalog al registro local.")
+    parser.add_argument("--alias", default=ALIAS,
+                        help=f"Alias del modelo ({ALIAS} = producción, {CHALLENGER_ALIAS} = modo sombra).")
+    args = parser.parse_args()
+    download_champion_model(args.alias)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import os
+import argparse
+import logging
+
+import uvicorn
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# SERVIDOR MULTI-WORKER
+# =========================================================
+# Arranca N procesos uvicorn que comparten una sola copia del modelo:
+# 1. El proceso principal exporta el modelo compilado (.npy) si no está al día.
+# 2. Cada worker lo mapea en memoria (COMPILED_MODEL_DIR, mmap de solo lectura),
+#    así que las páginas viven una vez en el page cache y no una por proceso.
+# 3. Los hilos del bosque (MODEL_N_JOBS) y de BLAS se reparten entre los workers.
+# 4. Cada worker escribe su propio spool y snapshot de velocidad (`<ruta>.<pid>`,
+#    ver utils/workers.py).
+#
+# El estado en memoria sigue siendo por proceso: /explain/{id} solo encuentra
+# las predicciones del worker que las hizo, así que con más de un worker hace
+# falta un balanceador con afinidad de sesión (sticky) delante. Por eso el
+# valor por defecto es un solo worker.
+#
+# Uso:
+#   python serve.py --workers 4
+#   WEB_CONCURRENCY=4 PORT=8000 python serve.py
+
+DEFAULT_COMPILED_DIR = os.path.join("models", "compiled")
+
+def preparar_modelo_compartido(directory):
+    """Exporta el modelo vigente a `directory` salvo que ya esté exportado. Devuelve su versión."""
+    # Importado recién aquí: inference lee COMPILED_MODEL_DIR y MODEL_N_JOBS al cargarse
+    import utils.inference as inference
+    from utils.compiled import read_compiled_meta
+
+    version = inference._resolver_artefacto()[1]
+    meta = read_compiled_meta(directory)
+    if meta is not None and meta.get("version") == version:
+        logger.info(f"✅ Modelo compilado {version} ya disponible en {directory}")
+        return version
+
+    return inference.export_compiled_model(directory)
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="FraudGuard con varios workers y modelo compartido.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    # Los workers la leen para separar sus archivos locales (utils/workers.py)
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    # Núcleos por worker: con 1 worker por núcleo el bosque corre en un solo hilo
+    hilos = str(max(1, cpus // workers))
+    for variable in ("MODEL_N_JOBS", "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(variable, hilos)
+
+    if os.getenv("USE_COMPILED_MODEL", "1") == "1":
+        directory = os.getenv("COMPILED_MODEL_DIR") or DEFAULT_COMPILED_DIR
+        os.environ["COMPILED_MODEL_DIR"] = directory
+        try:
+            preparar_modelo_compartido(directory)
+        except Exception as e:
+            # Sin modelo compartido cada worker carga el .pkl (funciona, pero usa N veces la memoria)
+            logger.error(f"⚠️ No se pudo exportar el modelo compartido: {e}")
+
+    logger.info(f"🚀 Iniciando {workers} workers ({os.environ['MODEL_N_JOBS']} hilos de modelo cada uno)")
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=workers)
+
+if __name__ == "__main__":
+    main()
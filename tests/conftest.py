@@ -0,0 +1,42 @@
+import os
+import sys
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS
+# ==============================================================================
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+import pytest
+
+# --- FIXTURES COMPARTIDAS (modelo real del repo) ---
+MODEL_PATH = os.path.join(project_root, "model_fraude.pkl")
+
+TIPOS = ["Online Purchase", "ATM Withdrawal", "POS Purchase", "Bank Transfer"]
+SEGMENTOS = ["Retail", "Business", "Corporate"]
+
+@pytest.fixture(scope="session")
+def pipeline():
+    import joblib
+    return joblib.load(MODEL_PATH)
+
+@pytest.fixture(scope="session")
+def compiled(pipeline):
+    from utils.compiled import compile_pipeline
+    return compile_pipeline(pipeline)
+
+@pytest.fixture(scope="session")
+def casos_de_borde():
+    """Función: cada edad con todos los tipos, segmentos y algunas horas y montos."""
+    def generar(edades):
+        return [
+            {"amount": monto, "hour": hora, "account_age": float(edad),
+             "transaction_type": tipo, "customer_segment": segmento}
+            for edad in edades
+            for tipo in TIPOS
+            for segmento in SEGMENTOS
+            for hora, monto in ((0, 5.0), (13, 250.0), (23, 98000.0))
+        ]
+    return generar
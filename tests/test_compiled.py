@@ -0,0 +1,35 @@
+import os
+import sys
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS
+# ==============================================================================
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+
+from utils.compiled import PARITY_TOLERANCE, generar_muestras
+
+# --- PARIDAD DEL MODELO COMPILADO CONTRA predict_proba ---
+# Fixtures `pipeline`, `compiled` y `casos_de_borde` en conftest.py
+
+def max_diff(pipeline, compiled, records):
+    from utils.inference import aplicar_feature_engineering_api
+
+    esperado = pipeline.predict_proba(aplicar_feature_engineering_api(pd.DataFrame(records)))[:, 1]
+    return float(np.max(np.abs(esperado - compiled.predict_proba_records(records))))
+
+def test_paridad_en_filas_aleatorias(pipeline, compiled):
+    assert max_diff(pipeline, compiled, generar_muestras(n=2000, seed=7)) <= PARITY_TOLERANCE
+
+def test_paridad_en_los_bordes_de_antiguedad(pipeline, compiled, casos_de_borde):
+    # Bordes de los intervalos (a, b] de tenure_group
+    assert max_diff(pipeline, compiled, casos_de_borde([0, 2, 10, 100])) <= PARITY_TOLERANCE
+
+def test_paridad_fuera_de_rango(pipeline, compiled, casos_de_borde):
+    # Fuera de TENURE_BINS el grupo queda en NaN y el one-hot en cero
+    assert max_diff(pipeline, compiled, casos_de_borde([-1, 150])) <= PARITY_TOLERANCE
@@ -0,0 +1,46 @@
+import os
+import sys
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS
+# ==============================================================================
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.compiled import PARITY_TOLERANCE, generar_muestras
+from utils.lookup import _montos_en_los_cortes, build_lookup_table
+
+# --- PARIDAD DE LA TABLA PRECALCULADA CONTRA predict_proba ---
+# Fixtures `pipeline`, `compiled` y `casos_de_borde` en conftest.py
+
+@pytest.fixture(scope="module")
+def tabla(compiled):
+    return build_lookup_table(compiled)
+
+def max_diff(pipeline, tabla, records):
+    from utils.inference import aplicar_feature_engineering_api
+
+    esperado = pipeline.predict_proba(aplicar_feature_engineering_api(pd.DataFrame(records)))[:, 1]
+    return float(np.max(np.abs(esperado - tabla.predict_proba_records(records))))
+
+def test_paridad_en_filas_aleatorias(pipeline, tabla):
+    assert max_diff(pipeline, tabla, generar_muestras(n=2000, seed=7)) <= PARITY_TOLERANCE
+
+def test_paridad_en_los_cortes_de_monto(pipeline, tabla):
+    # Montos justo en los umbrales del bosque, donde un error de intervalo se notaría
+    records = generar_muestras(n=len(_montos_en_los_cortes(tabla)), seed=3)
+    for registro, monto in zip(records, _montos_en_los_cortes(tabla)):
+        registro["amount"] = float(monto)
+    assert max_diff(pipeline, tabla, records) <= PARITY_TOLERANCE
+
+def test_paridad_en_los_bordes_de_antiguedad(pipeline, tabla, casos_de_borde):
+    assert max_diff(pipeline, tabla, casos_de_borde([0, 2, 10, 100])) <= PARITY_TOLERANCE
+
+def test_paridad_fuera_de_rango(pipeline, tabla, casos_de_borde):
+    assert max_diff(pipeline, tabla, casos_de_borde([-1, 150])) <= PARITY_TOLERANCE
@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import uuid
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS
+# ==============================================================================
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+from pymongo.errors import BulkWriteError
+
+from utils.persistence import DUPLICATE_KEY, MongoWriter
+
+# --- PRUEBAS DEL ESCRITOR EN SEGUNDO PLANO ---
+# Colección de mentira con solo `insert_many`: se puede "caer" para forzar el
+# spool y devuelve los duplicados de _id igual que Mongo (BulkWriteError 11000).
+
+class ColeccionFalsa:
+    def __init__(self):
+        self.docs = {}
+        self.caida = False
+
+    def insert_many(self, documents, ordered=False):
+        if self.caida:
+            raise ConnectionError("MongoDB no responde")
+        errores = []
+        for i, doc in enumerate(documents):
+            doc.setdefault("_id", uuid.uuid4().hex)
+            if doc["_id"] in self.docs:
+                errores.append({"index": i, "code": DUPLICATE_KEY})
+            else:
+                self.docs[doc["_id"]] = dict(doc)
+        if errores:
+            raise BulkWriteError({"writeErrors": errores})
+
+def crear_writer(tmp_path, coleccion, **kwargs):
+    kwargs.setdefault("retry_interval_s", 0)
+    return MongoWriter(coleccion, spool_path=str(tmp_path / "spool.jsonl"), **kwargs)
+
+def test_flush_escribe_en_lotes(tmp_path):
+    coleccion = ColeccionFalsa()
+    insertados = []
+    writer = crear_writer(tmp_path, coleccion, batch_size=2, flush_interval_s=0.05,
+                          after_insert=insertados.extend)
+    writer.start()
+    for i in range(5):
+        writer.write({"_id": f"doc-{i}", "n": i})
+    writer.stop()
+
+    assert sorted(coleccion.docs) == [f"doc-{i}" for i in range(5)]
+    assert len(insertados) == 5
+    assert writer.stats["written"] == 5
+    assert not os.path.exists(writer.spool_path)
+
+def test_mongo_caido_va_al_spool_y_se_reenvia(tmp_path):
+    coleccion = ColeccionFalsa()
+    writer = crear_writer(tmp_path, coleccion)
+
+    coleccion.caida = True
+    writer._flush([{"_id": "a"}, {"_id": "b"}])
+    assert writer.stats["spooled"] == 2
+    assert os.path.exists(writer.spool_path)
+
+    # Sigue caído: el .replay queda para el próximo intento
+    writer._maybe_replay()
+    assert os.path.exists(writer.spool_path + ".replay")
+
+    coleccion.caida = False
+    writer._maybe_replay()
+    assert sorted(coleccion.docs) == ["a", "b"]
+    assert writer.stats["replayed"] == 2
+    assert not os.path.exists(writer.spool_path + ".replay")
+
+def test_reenvio_no_duplica_lo_ya_insertado(tmp_path):
+    coleccion = ColeccionFalsa()
+    coleccion.docs["a"] = {"_id": "a"}
+    insertados = []
+    writer = crear_writer(tmp_path, coleccion, after_insert=insertados.extend)
+
+    writer._spool([{"_id": "a"}, {"_id": "b"}])
+    writer._maybe_replay()
+
+    assert sorted(coleccion.docs) == ["a", "b"]
+    assert [doc["_id"] for doc in insertados] == ["b"]
+
+def test_linea_cortada_va_al_bad(tmp_path):
+    coleccion = ColeccionFalsa()
+    writer = crear_writer(tmp_path, coleccion)
+
+    writer._spool([{"_id": "a"}, {"_id": "b"}])
+    with open(writer.spool_path, "a", encoding="utf-8") as f:
+        f.write('{"_id": "c", "amou')  # apagado a mitad de escritura
+
+    writer._maybe_replay()
+
+    assert sorted(coleccion.docs) == ["a", "b"]
+    assert writer.stats["bad_lines"] == 1
+    with open(writer.spool_path + ".bad", encoding="utf-8") as f:
+        assert f.read() == '{"_id": "c", "amou\n'
+    assert not os.path.exists(writer.spool_path + ".replay")
+
+def test_replay_que_desaparece_no_falla(tmp_path, monkeypatch):
+    import utils.persistence as persistence
+
+    coleccion = ColeccionFalsa()
+    writer = crear_writer(tmp_path, coleccion)
+    writer._spool([{"_id": "a"}])
+
+    # El .replay desaparece entre el reenvío y el borrado
+    def remove(path):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(persistence.os, "remove", remove)
+    writer._maybe_replay()
+    assert writer.stats["replayed"] == 1
+    assert sorted(coleccion.docs) == ["a"]
+
+def test_error_en_el_reenvio_no_mata_el_hilo(tmp_path, monkeypatch):
+    coleccion = ColeccionFalsa()
+    writer = crear_writer(tmp_path, coleccion, flush_interval_s=0.01)
+
+    fallos = []
+    def fallar():
+        fallos.append(1)
+        raise OSError("disco lleno")
+    monkeypatch.setattr(writer, "_replay", fallar)
+
+    writer.start()
+    try:
+        # Se espera a que el hilo pase varias veces por el reenvío que falla
+        limite = time.monotonic() + 5
+        while len(fallos) < 3 and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert len(fallos) >= 3
+        assert writer._thread.is_alive()
+
+        # Y lo que se escribe después sigue llegando a Mongo
+        writer.write({"_id": "despues"})
+        while "despues" not in coleccion.docs and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert "despues" in coleccion.docs
+        assert writer.stats["written"] == 1
+        assert writer._thread.is_alive()
+    finally:
+        writer.stop()
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS
+# ==============================================================================
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+from utils.velocity import VENTANAS, VelocityStore
+
+# --- PRUEBAS DEL SNAPSHOT DE VELOCIDAD ---
+T0 = 1_700_000_000.0
+
+def test_snapshot_y_restore_conservan_las_ventanas(tmp_path):
+    path = str(tmp_path / "velocity.json")
+    origen = VelocityStore()
+    for i in range(30):
+        origen.record(f"acc{i % 3}", 10.0 + i, "ATM Withdrawal" if i % 2 else "Online Purchase", now=T0 + i * 30)
+    assert origen.snapshot(path) == 3
+
+    destino = VelocityStore()
+    assert destino.restore(path, now=T0 + 900) == 3
+    for i in range(3):
+        assert destino.get(f"acc{i}", now=T0 + 900) == origen.get(f"acc{i}", now=T0 + 900)
+
+def test_restore_suma_la_misma_cuenta_de_varios_snapshots(tmp_path):
+    worker_a, worker_b = VelocityStore(), VelocityStore()
+    worker_a.record("acc", 100.0, "ATM Withdrawal", now=T0)
+    worker_a.record("acc", 50.0, "ATM Withdrawal", now=T0 + 10)
+    worker_b.record("acc", 25.0, "Online Purchase", now=T0 + 5)
+    # Fuera de la ventana de 1 minuto, dentro de la de 1 hora
+    worker_b.record("otra", 1.0, "POS Purchase", now=T0 - 600)
+    worker_a.snapshot(str(tmp_path / "a.json"))
+    worker_b.snapshot(str(tmp_path / "b.json"))
+
+    store = VelocityStore()
+    store.restore(str(tmp_path / "a.json"), now=T0 + 20)
+    store.restore(str(tmp_path / "b.json"), now=T0 + 20)
+
+    resumen = store.get("acc", now=T0 + 20)
+    assert resumen["count_1m"] == 3
+    assert resumen["amount_1m"] == 175.0
+    assert resumen["channels_1h"] == 2
+    assert store.get("otra", now=T0 + 20)["count_1h"] == 1
+
+def test_restore_lee_el_formato_anterior(tmp_path):
+    path = str(tmp_path / "velocity.json")
+    store = VelocityStore()
+    store.record("acc", 80.0, "ATM Withdrawal", now=T0)
+    cuenta = store._cuentas["acc"]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"saved_at": T0, "windows": VENTANAS,
+                   "accounts": {"acc": [cuenta.last_seen, cuenta.epocas, list(cuenta.conteos),
+                                        list(cuenta.sumas), list(cuenta.canales)]}}, f)
+
+    restaurado = VelocityStore()
+    assert restaurado.restore(path, now=T0 + 1) == 1
+    assert restaurado.get("acc", now=T0 + 1) == store.get("acc", now=T0 + 1)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+# ==============================================================================
+# BLOQUE DE AJUSTE DE RUTAS
+# ==============================================================================
+project_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+# ==============================================================================
+
+import utils.workers as workers
+from utils.persistence import MongoWriter
+
+# --- PRUEBAS DE LOS ARCHIVOS POR WORKER ---
+PID_MUERTO = 2 ** 22 + 7  # mayor que pid_max: nunca está vivo
+
+def escribir(path, texto):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(texto)
+
+def test_ruta_propia(monkeypatch):
+    monkeypatch.setattr(workers, "WEB_CONCURRENCY", 1)
+    assert workers.ruta_propia("spool.jsonl") == "spool.jsonl"
+    monkeypatch.setattr(workers, "WEB_CONCURRENCY", 4)
+    assert workers.ruta_propia("spool.jsonl") == f"spool.jsonl.{os.getpid()}"
+
+def test_reclama_solo_archivos_de_procesos_muertos(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "WEB_CONCURRENCY", 2)
+    base = str(tmp_path / "spool.jsonl")
+    escribir(base, "legado\n")
+    escribir(f"{base}.{PID_MUERTO}", "muerto\n")
+    escribir(f"{base}.{PID_MUERTO}.replay", "muerto replay\n")
+    escribir(f"{base}.{os.getppid()}", "vivo\n")
+    escribir(f"{base}.{os.getpid()}", "propio\n")
+    escribir(f"{base}.bad", "ilegible\n")
+
+    reclamados = workers.reclamar_huerfanos(base)
+
+    assert len(reclamados) == 3
+    contenidos = sorted(open(path, encoding="utf-8").read() for path in reclamados)
+    assert contenidos == ["legado\n", "muerto\n", "muerto replay\n"]
+    for path in (f"{base}.{os.getppid()}", f"{base}.{os.getpid()}", f"{base}.bad"):
+        assert os.path.exists(path)
+
+def test_el_writer_adopta_los_spools(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "WEB_CONCURRENCY", 2)
+    base = str(tmp_path / "spool.jsonl")
+    escribir(f"{base}.{PID_MUERTO}", '{"_id": "a"}\n{"_id": "b"}')
+
+    writer = MongoWriter(None, spool_path=workers.ruta_propia(base))
+    writer.adopt(workers.reclamar_huerfanos(base))
+
+    with open(writer.spool_path, encoding="utf-8") as f:
+        assert f.read() == '{"_id": "a"}\n{"_id": "b"}\n'
+    assert os.listdir(tmp_path) == [os.path.basename(writer.spool_path)]
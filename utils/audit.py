@@ -0,0 +1,174 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+import utils.metrics as metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Colecciones del registro de auditoría (la colección histórica "transacciones" no se toca)
+AUDIT_COLLECTION = os.getenv("AUDIT_COLLECTION", "audit_log")
+ROLLUP_COLLECTION = os.getenv("ROLLUP_COLLECTION", "fraud_rollups")
+# Puntajes campeón/challenger del modo sombra (utils/shadow.py)
+SHADOW_COLLECTION = os.getenv("SHADOW_COLLECTION", "shadow_log")
+# Días que se conserva cada registro (índice TTL sobre timestamp)
+AUDIT_TTL_DAYS = int(os.getenv("AUDIT_TTL_DAYS", "90"))
+
+INDEX_OPTIONS_CONFLICT = 85
+
+# Campos de entrada que se auditan (sin gráficos ni textos de la respuesta)
+CAMPOS_ENTRADA = ("amount", "hour", "account_age", "transaction_type", "customer_segment", "account_id")
+
+# Dimensiones de los rollups: nombre en la API -> campo de entrada
+DIMENSIONES = {"hour": "hour", "segment": "customer_segment", "channel": "transaction_type"}
+NIVELES_RIESGO = ("LOW", "MEDIUM", "HIGH")
+
+# =========================================================
+# REGISTRO COMPACTO
+# =========================================================
+def registro_auditoria(input_dict, result, prediction_id, endpoint, timestamp):
+    """
+    Documento de auditoría: entradas, puntaje, versión del modelo y una
+    referencia a la explicación (/explain/{id}) en vez del gráfico en base64.
+    `prediction_id` es el _id, así que reenviar el spool no duplica registros.
+    """
+    return {
+        "_id": prediction_id,
+        "timestamp": timestamp,
+        "endpoint": endpoint,
+        "input": {campo: input_dict[campo] for campo in CAMPOS_ENTRADA if input_dict.get(campo) is not None},
+        "probability_percent": result["probability_percent"],
+        "risk_level": result.get("risk_level", "LOW"),
+        "is_fraud": result["is_fraud"],
+        "model_version": result.get("model_version"),
+        "decided_by": result.get("decided_by"),
+        "explanation_ref": f"/explain/{prediction_id}" if result.get("prediction_id") else None,
+    }
+
+def _dia(timestamp):
+    return timestamp.strftime("%Y-%m-%d")
+
+# =========================================================
+# ALMACÉN DE AUDITORÍA + ROLLUPS
+# =========================================================
+class AuditStore:
+    """
+    Registro de auditoría con vencimiento por día y contadores pre-agregados.
+
+    Los registros van a `AUDIT_COLLECTION` con un índice TTL sobre timestamp
+    (AUDIT_TTL_DAYS, también para los pares del modo sombra) e índices para
+    filtrar por fecha y nivel de riesgo.
+    Por cada lote escrito, `apply_rollups` suma con $inc (upsert) un contador
+    por día y valor de cada dimensión (hora, segmento, canal) en
+    `ROLLUP_COLLECTION`: las tasas de fraude se responden leyendo unas decenas
+    de documentos, sin recorrer el registro.
+    """
+
+    def __init__(self, db, ttl_days=AUDIT_TTL_DAYS):
+        self.db = db
+        self.records = db.get_collection(AUDIT_COLLECTION)
+        self.rollups = db.get_collection(ROLLUP_COLLECTION)
+        self.shadow = db.get_collection(SHADOW_COLLECTION)
+        self.ttl_days = ttl_days
+        self._indexes_ok = False
+
+    def ensure_indexes(self):
+        """Crea los índices (idempotente). Ajusta el TTL si cambió AUDIT_TTL_DAYS."""
+        from pymongo.errors import OperationFailure
+
+        expire = self.ttl_days * 86400
+        for coleccion in (self.records, self.shadow):
+            try:
+                coleccion.create_index("timestamp", name="ttl_timestamp", expireAfterSeconds=expire)
+            except OperationFailure as e:
+                if e.code != INDEX_OPTIONS_CONFLICT:
+                    raise
+                self.db.command("collMod", coleccion.name,
+                                index={"name": "ttl_timestamp", "expireAfterSeconds": expire})
+        self.records.create_index([("risk_level", 1), ("timestamp", -1)], name="risk_level_timestamp")
+        self.rollups.create_index([("dim", 1), ("day", 1)], name="dim_day")
+        self._indexes_ok = True
+        logger.info(f"✅ Índices de auditoría listos ({AUDIT_COLLECTION}, TTL {self.ttl_days} días).")
+
+    def apply_rollups(self, documents):
+        """Suma los registros recién insertados a los contadores diarios (un bulk_write por lote)."""
+        from pymongo import UpdateOne
+
+        if not self._indexes_ok:
+            self.ensure_indexes()
+
+        incrementos = {}
+        for doc in documents:
+            dia = _dia(doc["timestamp"])
+            for dimension, campo in DIMENSIONES.items():
+                valor = str(doc["input"][campo])
+                inc = incrementos.setdefault((dia, dimension, valor), {
+                    "total": 0, "blocked": 0, "scored": 0, "probability_sum": 0.0,
+                    **{f"risk.{nivel}": 0 for nivel in NIVELES_RIESGO},
+                })
+                inc["total"] += 1
+                inc["blocked"] += int(bool(doc["is_fraud"]))
+                # Las decisiones de reglas no tienen probabilidad: no entran en la media
+                if doc["probability_percent"] is not None:
+                    inc["scored"] += 1
+                    inc["probability_sum"] += doc["probability_percent"] / 100
+                inc[f"risk.{doc['risk_level']}"] = inc.get(f"risk.{doc['risk_level']}", 0) + 1
+
+        if not incrementos:
+            return
+        self.rollups.bulk_write([
+            UpdateOne(
+                {"_id": f"{dimension}|{dia}|{valor}"},
+                {"$inc": inc, "$setOnInsert": {"dim": dimension, "day": dia, "key": valor}},
+                upsert=True,
+            )
+            for (dia, dimension, valor), inc in incrementos.items()
+        ], ordered=False)
+
+    # -----------------------------------------------------
+    # Consultas
+    # -----------------------------------------------------
+    def fraud_rate(self, dimension, days, now=None):
+        """Tasa de bloqueo por valor de la dimensión en los últimos `days` días (incluido hoy)."""
+        now = now or datetime.utcnow()
+        desde = _dia(now - timedelta(days=days - 1))
+
+        with metrics.timed("mongo_read"):
+            filas = list(self.rollups.find(
+                {"dim": dimension, "day": {"$gte": desde}},
+                {"_id": 0, "key": 1, "total": 1, "blocked": 1, "scored": 1, "probability_sum": 1, "risk": 1},
+            ))
+
+        por_valor = {}
+        for fila in filas:
+            acumulado = por_valor.setdefault(fila["key"], {
+                "total": 0, "blocked": 0, "scored": 0, "probability_sum": 0.0, "risk": dict.fromkeys(NIVELES_RIESGO, 0),
+            })
+            acumulado["total"] += fila.get("total", 0)
+            acumulado["blocked"] += fila.get("blocked", 0)
+            # Rollups anteriores a "scored": todas sus transacciones sumaron probabilidad
+            acumulado["scored"] += fila.get("scored", fila.get("total", 0))
+            acumulado["probability_sum"] += fila.get("probability_sum", 0.0)
+            for nivel, conteo in fila.get("risk", {}).items():
+                acumulado["risk"][nivel] = acumulado["risk"].get(nivel, 0) + conteo
+
+        orden = (lambda k: int(k)) if dimension == "hour" else (lambda k: k)
+        buckets = [
+            {
+                "key": valor,
+                "total": a["total"],
+                "blocked": a["blocked"],
+                "fraud_rate": round(a["blocked"] / a["total"], 4) if a["total"] else 0.0,
+                "mean_probability": round(a["probability_sum"] / a["scored"], 4) if a["scored"] else None,
+                "risk_levels": a["risk"],
+            }
+            for valor, a in sorted(por_valor.items(), key=lambda item: orden(item[0]))
+        ]
+        return {
+            "dimension": dimension,
+            "days": days,
+            "since": desde,
+            "total": sum(b["total"] for b in buckets),
+            "buckets": buckets,
+        }
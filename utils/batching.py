@@ -0,0 +1,115 @@
+import os
+import asyncio
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Ventana máxima de espera para juntar peticiones y tamaño máximo del lote
+MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+
+# =========================================================
+# MICRO-BATCHING DINÁMICO
+# =========================================================
+async def recolectar_lote(cola, max_batch_size, max_wait):
+    """Bloquea hasta el primer item de `cola`; luego espera como máximo `max_wait` s por más."""
+    batch = [await cola.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+
+    while len(batch) < max_batch_size:
+        # Lo que ya está en cola se toma sin esperar
+        if not cola.empty():
+            batch.append(cola.get_nowait())
+            continue
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(cola.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+
+    return batch
+
+class MicroBatcher:
+    """
+    Agrupa llamadas concurrentes de una en una en un solo lote.
+
+    Cada llamador deja su transacción en la cola y espera su propio future.
+    Un worker de fondo junta hasta `max_batch_size` items (o lo que llegue
+    en `max_wait_ms`), ejecuta `score_fn(lista)` en un hilo para no bloquear
+    el event loop, y reparte cada resultado a su future en orden.
+    """
+
+    def __init__(self, score_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.score_fn = score_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = None
+        self._worker = None
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"✅ Micro-batching activo (máx. {self.max_batch_size} items / {self.max_wait * 1000:.1f} ms)"
+        )
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Nadie más va a atender lo que quedó en cola
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher detenido"))
+
+    async def submit(self, item):
+        if self._worker is None:
+            raise RuntimeError("Micro-batcher no iniciado")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        return await recolectar_lote(self._queue, self.max_batch_size, self.max_wait)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Peticiones canceladas (cliente desconectado) no se puntúan
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    None, self.score_fn, [item for item, _ in batch]
+                )
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Micro-batcher detenido"))
+                raise
+            except Exception as e:
+                logger.error(f"Error en micro-batch: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
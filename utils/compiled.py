@@ -0,0 +1,331 @@
+import os
+import json
+import logging
+import numpy as np
+
+from utils.inference import TENURE_BINS, TENURE_LABELS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tolerancia máxima aceptada entre el scorer compilado y predict_proba
+PARITY_TOLERANCE = 1e-9
+
+# =========================================================
+# FEATURE ENGINEERING VECTORIZADO (sin pandas)
+# =========================================================
+# Réplica exacta de inference.aplicar_feature_engineering_api sobre arrays
+# de NumPy. Cada entrada produce una columna derivada a partir de las crudas.
+
+# pd.cut deja NaN fuera de rango -> astype(str) = "nan"
+_TENURE_BINS = np.asarray(TENURE_BINS, dtype=np.float64)
+_TENURE_LABELS = np.array(["nan"] + TENURE_LABELS + ["nan"], dtype=object)
+
+def _tenure_group(account_age):
+    # Intervalos (a, b]: searchsorted por la izquierda da el índice del bin
+    return _TENURE_LABELS[np.searchsorted(_TENURE_BINS, account_age, side="left")]
+
+def _segment_tenure_profile(raw):
+    tenure = _tenure_group(raw["account_age"])
+    return np.array(
+        [f"{segment}_{group}" for segment, group in zip(raw["customer_segment"], tenure)],
+        dtype=object,
+    )
+
+_DERIVADAS = {
+    "amount_log": lambda raw: np.log1p(raw["amount"]),
+    "hour_sin": lambda raw: np.sin(2 * np.pi * raw["hour"] / 24),
+    "hour_cos": lambda raw: np.cos(2 * np.pi * raw["hour"] / 24),
+    "is_night": lambda raw: ((raw["hour"] >= 23) | (raw["hour"] <= 5)).astype(np.float64),
+    "transaction_type": lambda raw: raw["transaction_type"],
+    "segment_tenure_profile": _segment_tenure_profile,
+}
+
+def _columnas_crudas(records):
+    """Lista de dicts -> arrays columnares con los tipos que usa el modelo."""
+    return {
+        "amount": np.array([r["amount"] for r in records], dtype=np.float64),
+        "hour": np.array([r["hour"] for r in records], dtype=np.float64),
+        "account_age": np.array([r["account_age"] for r in records], dtype=np.float64),
+        "transaction_type": np.array([r["transaction_type"] for r in records], dtype=object),
+        "customer_segment": np.array([r["customer_segment"] for r in records], dtype=object),
+    }
+
+# =========================================================
+# MODELO COMPILADO
+# =========================================================
+class CompiledModel:
+    """
+    Versión "aplanada" del Pipeline de imblearn: estadísticas del scaler,
+    categorías del one-hot y los árboles del bosque como arrays planos.
+
+    Todos los árboles comparten un único juego de arrays (children, feature,
+    threshold, leaf_proba); `roots` indica el nodo raíz de cada uno.
+    Las hojas apuntan a sí mismas, así que basta iterar `max_depth` pasos.
+    Los arrays se usan tal cual, así que pueden venir de np.load(mmap_mode="r").
+    """
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+
+        self.n_features = int(meta["n_features"])
+        self.max_depth = int(meta["max_depth"])
+        self.num_columns = list(meta["num_columns"])
+        self.num_offset = int(meta["num_offset"])
+        self.passthrough_columns = list(meta["passthrough_columns"])
+        self.passthrough_offset = int(meta["passthrough_offset"])
+
+        # Por cada columna categórica: {categoría: índice absoluto en X}
+        self.cat_index = []
+        for column, offset, categories in zip(
+            meta["cat_columns"], meta["cat_offsets"], meta["categories"]
+        ):
+            self.cat_index.append(
+                (column, {cat: offset + i for i, cat in enumerate(categories)})
+            )
+
+        self.scaler_mean = arrays["scaler_mean"]
+        self.scaler_scale = arrays["scaler_scale"]
+        # children[nodo] = (izquierdo, derecho); se indexa con (x > umbral)
+        self.children = arrays["children"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.leaf_proba = arrays["leaf_proba"]
+        self.roots = arrays["roots"]
+
+    # -----------------------------------------------------
+    # Transformación
+    # -----------------------------------------------------
+    def transform(self, raw):
+        """Columnas crudas -> matriz X (n, n_features) tal como la ve el bosque."""
+        n = len(raw["amount"])
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+
+        for j, column in enumerate(self.num_columns):
+            value = _DERIVADAS[column](raw)
+            X[:, self.num_offset + j] = (value - self.scaler_mean[j]) / self.scaler_scale[j]
+
+        for j, column in enumerate(self.passthrough_columns):
+            X[:, self.passthrough_offset + j] = _DERIVADAS[column](raw)
+
+        # handle_unknown='ignore': categorías desconocidas quedan en cero
+        rows = np.arange(n)
+        for column, index in self.cat_index:
+            values = _DERIVADAS[column](raw)
+            cols = np.array([index.get(v, -1) for v in values], dtype=np.int64)
+            known = cols >= 0
+            X[rows[known], cols[known]] = 1.0
+
+        # El bosque de sklearn compara en float32
+        return X.astype(np.float32)
+
+    # -----------------------------------------------------
+    # Evaluación del bosque
+    # -----------------------------------------------------
+    def predict_proba_matrix(self, X):
+        """Probabilidad de la clase positiva para cada fila de X."""
+        if X.shape[0] == 1:
+            # Camino rápido de una fila: todo en 1-D sobre los árboles
+            x = X[0]
+            node = self.roots
+            for _ in range(self.max_depth):
+                go_right = x[self.feature[node]] > self.threshold[node]
+                node = self.children[node, go_right.view(np.int8)]
+            return np.array([self.leaf_proba[node].mean()])
+
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.roots.shape[0]))
+
+        for _ in range(self.max_depth):
+            go_right = X[rows, self.feature[node]] > self.threshold[node]
+            node = self.children[node, go_right.view(np.int8)]
+
+        return self.leaf_proba[node].mean(axis=1)
+
+    def predict_proba_records(self, records):
+        return self.predict_proba_matrix(self.transform(_columnas_crudas(records)))
+
+    def predict_proba_one(self, input_data: dict):
+        return float(self.predict_proba_records([input_data])[0])
+
+# =========================================================
+# COMPILACIÓN DESDE EL PIPELINE
+# =========================================================
+def compile_pipeline(pipeline):
+    """
+    Extrae del Pipeline ajustado todo lo necesario para puntuar sin sklearn.
+    Lanza ValueError si la estructura no es la esperada
+    (ColumnTransformer -> [samplers] -> RandomForestClassifier).
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+    steps = [step for _, step in pipeline.steps]
+    preprocess, forest = steps[0], steps[-1]
+
+    if not isinstance(preprocess, ColumnTransformer):
+        raise ValueError("El primer paso no es un ColumnTransformer")
+    if not isinstance(forest, RandomForestClassifier):
+        raise ValueError("El último paso no es un RandomForestClassifier")
+    # Los pasos intermedios deben ser samplers (SMOTE), que no actúan en inferencia
+    for step in steps[1:-1]:
+        if not hasattr(step, "fit_resample"):
+            raise ValueError(f"Paso intermedio no soportado: {type(step).__name__}")
+
+    meta = {"num_columns": [], "num_offset": 0, "passthrough_columns": [],
+            "passthrough_offset": 0, "cat_columns": [], "cat_offsets": [], "categories": []}
+    arrays = {"scaler_mean": np.zeros(0), "scaler_scale": np.ones(0)}
+
+    for name, transformer, columns in preprocess.transformers_:
+        if name == "remainder":
+            continue
+        columns = list(columns)
+        for column in columns:
+            if column not in _DERIVADAS:
+                raise ValueError(f"Columna sin derivación conocida: {column}")
+        offset = preprocess.output_indices_[name].start
+
+        if isinstance(transformer, StandardScaler):
+            meta["num_columns"] = columns
+            meta["num_offset"] = offset
+            arrays["scaler_mean"] = np.asarray(
+                transformer.mean_ if transformer.with_mean else np.zeros(len(columns)), dtype=np.float64)
+            arrays["scaler_scale"] = np.asarray(
+                transformer.scale_ if transformer.with_std else np.ones(len(columns)), dtype=np.float64)
+
+        elif transformer == "passthrough" or (
+            isinstance(transformer, FunctionTransformer) and transformer.func is None
+        ):
+            meta["passthrough_columns"] = columns
+            meta["passthrough_offset"] = offset
+
+        elif isinstance(transformer, OneHotEncoder):
+            if transformer.drop_idx_ is not None or transformer.handle_unknown != "ignore":
+                raise ValueError("OneHotEncoder con drop/handle_unknown no soportado")
+            position = offset
+            for column, categories in zip(columns, transformer.categories_):
+                meta["cat_columns"].append(column)
+                meta["cat_offsets"].append(position)
+                meta["categories"].append([str(c) for c in categories])
+                position += len(categories)
+
+        else:
+            raise ValueError(f"Transformador no soportado: {name} ({type(transformer).__name__})")
+
+    # --- Bosque: concatenar todos los árboles en arrays planos ---
+    positive = list(forest.classes_).index(1)
+    children, feature, threshold, leaf_proba, roots = [], [], [], [], []
+    base = 0
+    max_depth = 0
+
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        # Las hojas se apuntan a sí mismas y nunca cambian de nodo
+        children.append(np.stack([
+            np.where(is_leaf, node_ids, tree.children_left),
+            np.where(is_leaf, node_ids, tree.children_right),
+        ], axis=1) + base)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+
+        value = tree.value[:, 0, :]
+        leaf_proba.append(value[:, positive] / value.sum(axis=1))
+
+        roots.append(base)
+        base += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays.update({
+        "children": np.concatenate(children).astype(np.intp),
+        "feature": np.concatenate(feature).astype(np.intp),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "leaf_proba": np.concatenate(leaf_proba).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.intp),
+    })
+    meta["n_features"] = int(forest.n_features_in_)
+    meta["max_depth"] = int(max_depth)
+
+    return CompiledModel(arrays, meta)
+
+# =========================================================
+# ARTEFACTO COMPACTO (memory-mappable)
+# =========================================================
+# Un .npy por array + meta.json. Con np.load(mmap_mode="r") todos los workers
+# de uvicorn comparten las mismas páginas del page cache en vez de copiar el modelo.
+META_FILE = "meta.json"
+
+def save_compiled(compiled, directory, version=None):
+    os.makedirs(directory, exist_ok=True)
+    # Cada archivo se reemplaza entero (os.replace): un proceso que ya tiene
+    # mapeada la versión anterior sigue leyendo el archivo viejo, y dos
+    # procesos que exportan lo mismo a la vez no se pisan a medio escribir
+    sufijo = f".{os.getpid()}.tmp"
+    for name, array in compiled.arrays.items():
+        path = os.path.join(directory, f"{name}.npy")
+        with open(path + sufijo, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(path + sufijo, path)
+
+    meta = dict(compiled.meta, version=version, arrays=sorted(compiled.arrays))
+    # meta.json se escribe al final: su presencia indica un artefacto completo
+    tmp_path = os.path.join(directory, META_FILE + sufijo)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(directory, META_FILE))
+
+def read_compiled_meta(directory):
+    """meta.json del artefacto, o None si no hay uno completo en `directory`."""
+    path = os.path.join(directory, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def load_compiled(directory, mmap_mode="r"):
+    meta = read_compiled_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(f"No hay un modelo compilado en {directory}")
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in meta["arrays"]
+    }
+    return CompiledModel(arrays, meta)
+
+# =========================================================
+# VERIFICACIÓN DE PARIDAD
+# =========================================================
+def generar_muestras(n=500, seed=0):
+    """Transacciones sintéticas que cubren todas las horas, tipos, segmentos y tenures."""
+    rng = np.random.default_rng(seed)
+    tipos = ["Online Purchase", "ATM Withdrawal", "POS Purchase", "Bank Transfer"]
+    segmentos = ["Retail", "Business", "Corporate"]
+    return [
+        {
+            "amount": float(np.round(np.exp(rng.uniform(0, 12)), 2)),
+            "hour": int(rng.integers(0, 24)),
+            "account_age": float(np.round(rng.uniform(0, 40), 1)),
+            "transaction_type": tipos[int(rng.integers(len(tipos)))],
+            "customer_segment": segmentos[int(rng.integers(len(segmentos)))],
+        }
+        for _ in range(n)
+    ]
+
+def verificar_paridad(pipeline, compiled, records=None):
+    """Devuelve la máxima diferencia absoluta frente a predict_proba del Pipeline."""
+    import pandas as pd
+    from utils.inference import aplicar_feature_engineering_api
+
+    if records is None:
+        records = generar_muestras()
+
+    df = aplicar_feature_engineering_api(pd.DataFrame(records))
+    expected = pipeline.predict_proba(df)[:, 1]
+    actual = compiled.predict_proba_records(records)
+
+    return float(np.max(np.abs(expected - actual)))
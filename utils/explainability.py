@@ -1,12 +1,19 @@
-import matplotlib
-# Configuración para servidores sin pantalla (Headless) - VITAL para Render
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import io
 import base64
-import numpy as np
 import os
 import sys
+import time
+import asyncio
+import contextvars
+import logging
+import threading
+import itertools
+import functools
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # ==============================================================================
 # BLOQUE DE AJUSTE DE RUTAS (AGREGAR ESTO AL INICIO)
@@ -27,6 +34,268 @@ if project_root not in sys.path:
 os.chdir(project_root)
 # ==============================================================================
 
+import utils.metrics as metrics
+
+
+# ==============================================================================
+# BUCKETS DE INTERPRETACIÓN
+# ==============================================================================
+# El gráfico depende solo de 4 variables discretizadas:
+# 3 bandas de monto x 3 de hora x 3 de antigüedad x 2 clases de canal = 54 gráficos.
+# Cada bucket aporta una barra (etiqueta, contribución).
+#    Positivo  -> empuja a FRAUDE
+#    Negativo  -> empuja a SEGURO
+HORAS_MADRUGADA = [23, 0, 1, 2, 3, 4, 5]
+
+# --- A. MONTO (el modelo usa log1p, aquí explicamos en términos relativos)
+CONTRIB_MONTO = [
+    ('Monto Bajo', -0.2),
+    ('Monto Moderado', 0.25),
+    ('Monto Relativamente Alto', 0.6),
+]
+# --- B. HORA (patrón cíclico: madrugada vs horario típico)
+# Representa indirectamente hour_sin / hour_cos
+CONTRIB_HORA = [
+    ('Patrón Horario Habitual', -0.3),
+    ('Patrón Horario Intermedio', 0.05),
+    ('Patrón Horario Atípico (Madrugada)', 0.4),
+]
+# --- C. ANTIGÜEDAD (buckets reales del modelo)
+# tenure_group = New / Established / Veteran
+CONTRIB_ANTIGUEDAD = [
+    ('Cliente Veterano', -0.4),
+    ('Cliente Establecido', 0.1),
+    ('Cliente Nuevo (Tenure Bajo)', 0.45),
+]
+# --- D. TIPO DE TRANSACCIÓN
+CONTRIB_CANAL = [
+    ('Canal Transaccional Habitual', -0.1),
+    ('Canal Transaccional de Mayor Riesgo', 0.15),
+]
+
+def calcular_buckets(monto, hora, antiguedad, tipo):
+    """Devuelve la tupla (monto, hora, antigüedad, canal) de índices de bucket."""
+    if monto > 10000:
+        b_monto = 2
+    elif monto > 1000:
+        b_monto = 1
+    else:
+        b_monto = 0
+
+    if hora in HORAS_MADRUGADA:
+        b_hora = 2
+    elif 9 <= hora <= 18:
+        b_hora = 0
+    else:
+        b_hora = 1
+
+    if antiguedad <= 2:
+        b_antiguedad = 2
+    elif antiguedad > 10:
+        b_antiguedad = 0
+    else:
+        b_antiguedad = 1
+
+    b_canal = 1 if tipo in ['ATM Withdrawal', 'Online Purchase'] else 0
+
+    return (b_monto, b_hora, b_antiguedad, b_canal)
+
+def calcular_contribuciones(buckets):
+    """Contribuciones (proxy del razonamiento del modelo) para una tupla de buckets."""
+    b_monto, b_hora, b_antiguedad, b_canal = buckets
+    return dict([
+        CONTRIB_MONTO[b_monto],
+        CONTRIB_HORA[b_hora],
+        CONTRIB_ANTIGUEDAD[b_antiguedad],
+        CONTRIB_CANAL[b_canal],
+    ])
+
+# ==============================================================================
+# CACHÉ DE GRÁFICOS
+# ==============================================================================
+_CHART_CACHE = {}
+_CACHE_STATS = {"hits": 0, "misses": 0}
+_CACHE_LOCK = threading.Lock()
+
+TODOS_LOS_BUCKETS = list(itertools.product(
+    range(len(CONTRIB_MONTO)),
+    range(len(CONTRIB_HORA)),
+    range(len(CONTRIB_ANTIGUEDAD)),
+    range(len(CONTRIB_CANAL)),
+))
+
+def _render_chart(contributions):
+    """Gráfico horizontal (interpretabilidad visual) codificado en base64."""
+    # matplotlib se importa recién al primer render (arranque más rápido).
+    # API orientada a objetos (Figure + canvas Agg): sin estado global de pyplot,
+    # así que es seguro renderizar desde varios hilos a la vez. Al no pasar por
+    # pyplot no hace falta matplotlib.use('Agg') para servidores sin pantalla.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    inicio = time.perf_counter()
+    features = list(contributions.keys())
+    values = list(contributions.values())
+    colors = ['#ff4b4b' if v > 0 else '#1e88e5' for v in values]
+
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.barh(features, values, color=colors, height=0.6)
+    ax.axvline(0, color='black', linewidth=0.8, linestyle='--')
+
+    ax.set_title('Factores de Influencia en la Decisión', fontsize=12)
+    ax.set_xlabel('Impacto en el Riesgo (← Seguro | Fraude →)', fontsize=10)
+    ax.tick_params(axis='y', labelsize=9)
+
+    ax.grid(axis='x', linestyle=':', alpha=0.5)
+    fig.subplots_adjust(left=0.30, right=0.95, top=0.9, bottom=0.15)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', transparent=True, dpi=100)
+    metrics.observe("chart_render", time.perf_counter() - inicio)
+
+    with metrics.timed("base64_encode"):
+        return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+def get_chart(buckets):
+    """Devuelve el gráfico de una tupla de buckets, renderizándolo solo la primera vez."""
+    with _CACHE_LOCK:
+        image_base64 = _CHART_CACHE.get(buckets)
+        if image_base64 is not None:
+            _CACHE_STATS["hits"] += 1
+            return image_base64
+        _CACHE_STATS["misses"] += 1
+
+    image_base64 = _render_chart(calcular_contribuciones(buckets))
+
+    with _CACHE_LOCK:
+        _CHART_CACHE[buckets] = image_base64
+    return image_base64
+
+def precompute_charts():
+    """Renderiza los 54 gráficos posibles (se puede llamar al arrancar)."""
+    for buckets in TODOS_LOS_BUCKETS:
+        with _CACHE_LOCK:
+            if buckets in _CHART_CACHE:
+                continue
+        image_base64 = _render_chart(calcular_contribuciones(buckets))
+        with _CACHE_LOCK:
+            _CHART_CACHE[buckets] = image_base64
+    logger.info(f"✅ Gráficos explicativos precalculados: {len(_CHART_CACHE)}")
+
+def get_cache_stats():
+    with _CACHE_LOCK:
+        return {
+            "size": len(_CHART_CACHE),
+            "capacity": len(TODOS_LOS_BUCKETS),
+            "hits": _CACHE_STATS["hits"],
+            "misses": _CACHE_STATS["misses"],
+        }
+
+def _metricas_cache():
+    stats = get_cache_stats()
+    return {
+        "fraudguard_chart_cache_size": ("gauge", "Gráficos explicativos en caché.", {(): stats["size"]}),
+        "fraudguard_chart_cache_hits_total": ("counter", "Caché de gráficos: hits.", {(): stats["hits"]}),
+        "fraudguard_chart_cache_misses_total": ("counter", "Caché de gráficos: misses.", {(): stats["misses"]}),
+    }
+
+metrics.register_collector(_metricas_cache)
+
+# ==============================================================================
+# FORMATOS LIVIANOS (SVG y contribuciones crudas)
+# ==============================================================================
+# Alternativas al PNG en base64: un SVG armado a mano (~1.5 KB, sin matplotlib)
+# o directamente las contribuciones para que el cliente dibuje las barras.
+SVG_ANCHO, SVG_ALTO_BARRA, SVG_ETIQUETAS = 520, 34, 230
+
+@functools.lru_cache(maxsize=len(TODOS_LOS_BUCKETS))
+def get_svg(buckets):
+    """Gráfico de barras horizontales en SVG para una tupla de buckets (cacheado)."""
+    contributions = calcular_contribuciones(buckets)
+    alto = 50 + SVG_ALTO_BARRA * len(contributions) + 30
+    centro = SVG_ETIQUETAS + (SVG_ANCHO - SVG_ETIQUETAS - 20) / 2
+    escala = (SVG_ANCHO - SVG_ETIQUETAS - 30) / 2 / max(abs(v) for v in contributions.values())
+
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {SVG_ANCHO} {alto}" font-family="sans-serif">',
+        f'<text x="{SVG_ANCHO / 2:.0f}" y="24" font-size="15" text-anchor="middle">Factores de Influencia en la Decisión</text>',
+    ]
+    for i, (feature, value) in enumerate(contributions.items()):
+        y = 45 + i * SVG_ALTO_BARRA
+        ancho = abs(value) * escala
+        x = centro if value > 0 else centro - ancho
+        color = '#ff4b4b' if value > 0 else '#1e88e5'
+        partes.append(f'<text x="{SVG_ETIQUETAS - 8}" y="{y + 16}" font-size="11" text-anchor="end">{escape(feature)}</text>')
+        partes.append(f'<rect x="{x:.1f}" y="{y + 4}" width="{ancho:.1f}" height="20" fill="{color}"/>')
+
+    partes.append(f'<line x1="{centro:.1f}" y1="40" x2="{centro:.1f}" y2="{alto - 30}" stroke="black" stroke-dasharray="4 3"/>')
+    partes.append(f'<text x="{centro:.0f}" y="{alto - 10}" font-size="11" text-anchor="middle">'
+                  'Impacto en el Riesgo (← Seguro | Fraude →)</text>')
+    partes.append('</svg>')
+    return "".join(partes)
+
+def _leer_campos(data_dict):
+    """(buckets, texto) a partir de los campos crudos: única lectura de la entrada para todos los modos."""
+    monto = float(data_dict.get('amount', 0))
+    hora = int(data_dict.get('hour', 0))
+    antiguedad = float(data_dict.get('account_age', 0))
+    tipo = str(data_dict.get('transaction_type', ''))
+    return calcular_buckets(monto, hora, antiguedad, tipo), _build_text(monto, hora, antiguedad)
+
+def generate_explanation_svg(data_dict):
+    """Retorna: (svg, texto_explicativo). Sin matplotlib: sirve dentro del event loop."""
+    try:
+        buckets, explanation_text = _leer_campos(data_dict)
+        return get_svg(buckets), explanation_text
+    except Exception as e:
+        logger.error(f"Error SHAP: {e}")
+        return None, "No se pudo generar el gráfico explicativo."
+
+def generate_explanation_contributions(data_dict):
+    """Retorna: (contribuciones {factor: impacto}, texto_explicativo) para dibujar en el cliente."""
+    try:
+        buckets, explanation_text = _leer_campos(data_dict)
+        return calcular_contribuciones(buckets), explanation_text
+    except Exception as e:
+        logger.error(f"Error SHAP: {e}")
+        return None, "No se pudo generar el gráfico explicativo."
+
+# ==============================================================================
+# TEXTO EXPLICATIVO
+# ==============================================================================
+def _build_text(monto, hora, antiguedad):
+    """Texto explicativo (alineado al FE real). Incluye la hora exacta, por eso no se cachea."""
+    text_parts = []
+
+    if monto > 1000:
+        text_parts.append("el monto es elevado en relación al comportamiento típico del sistema")
+
+    if hora in HORAS_MADRUGADA:
+        text_parts.append(f"la operación ocurre en un patrón horario atípico ({hora}:00 hrs)")
+
+    if antiguedad <= 2:
+        text_parts.append("la cuenta pertenece a un grupo de clientes nuevos")
+
+    if text_parts:
+        return (
+            "⚠️ Factores de Riesgo Detectados: "
+            "La alerta se genera principalmente porque "
+            + " y ".join(text_parts)
+            + ".\n\n"
+            "ℹ️ Nota: Esta explicación es una aproximación interpretativa "
+            "basada en patrones generales aprendidos por el modelo, "
+            "y no corresponde a los pesos matemáticos internos exactos."
+        )
+
+    return (
+        "✅ Factores de Seguridad: "
+        "La transacción presenta un patrón consistente con el comportamiento esperado "
+        "para clientes similares, sin señales claras de riesgo inmediato.\n\n"
+        "ℹ️ Nota: Esta explicación resume factores generales y no representa "
+        "directamente los cálculos internos del modelo."
+    )
 
 def generate_explanation(data_dict):
     """
@@ -37,113 +306,16 @@ def generate_explanation(data_dict):
     Esta explicación NO representa los pesos internos reales del modelo.
     Es una capa interpretativa diseñada para humanos, basada en patrones
     comúnmente asociados al fraude según el entrenamiento del sistema.
+
+    El gráfico se sirve desde una caché en memoria indexada por buckets,
+    así que matplotlib solo se ejecuta la primera vez que aparece cada combinación.
     
     Retorna: (imagen_base64, texto_explicativo)
     """
     try:
-        # ------------------------------------------------------------------
-        # 1. Extracción de variables crudas (las únicas disponibles en la app)
-        # ------------------------------------------------------------------
-        monto = float(data_dict.get('amount', 0))
-        hora = int(data_dict.get('hour', 0))
-        antiguedad = float(data_dict.get('account_age', 0))
-        tipo = str(data_dict.get('transaction_type', ''))
-
-        # ------------------------------------------------------------------
-        # 2. Construcción de contribuciones (proxy del razonamiento del modelo)
-        #    Positivo  -> empuja a FRAUDE
-        #    Negativo  -> empuja a SEGURO
-        # ------------------------------------------------------------------
-        contributions = {}
-
-        # --- A. MONTO (el modelo usa log1p, aquí explicamos en términos relativos)
-        if monto > 10000:
-            contributions['Monto Relativamente Alto'] = 0.6
-        elif monto > 1000:
-            contributions['Monto Moderado'] = 0.25
-        else:
-            contributions['Monto Bajo'] = -0.2
-
-        # --- B. HORA (patrón cíclico: madrugada vs horario típico)
-        # Representa indirectamente hour_sin / hour_cos
-        if hora in [23, 0, 1, 2, 3, 4, 5]:
-            contributions['Patrón Horario Atípico (Madrugada)'] = 0.4
-        elif 9 <= hora <= 18:
-            contributions['Patrón Horario Habitual'] = -0.3
-        else:
-            contributions['Patrón Horario Intermedio'] = 0.05
-
-        # --- C. ANTIGÜEDAD (buckets reales del modelo)
-        # tenure_group = New / Established / Veteran
-        if antiguedad <= 2:
-            contributions['Cliente Nuevo (Tenure Bajo)'] = 0.45
-        elif antiguedad > 10:
-            contributions['Cliente Veterano'] = -0.4
-        else:
-            contributions['Cliente Establecido'] = 0.1
-
-        # --- D. TIPO DE TRANSACCIÓN
-        if tipo in ['ATM Withdrawal', 'Online Purchase']:
-            contributions['Canal Transaccional de Mayor Riesgo'] = 0.15
-        else:
-            contributions['Canal Transaccional Habitual'] = -0.1
-
-        # ------------------------------------------------------------------
-        # 3. Gráfico Horizontal (interpretabilidad visual)
-        # ------------------------------------------------------------------
-        features = list(contributions.keys())
-        values = list(contributions.values())
-        colors = ['#ff4b4b' if v > 0 else '#1e88e5' for v in values]
-
-        plt.figure(figsize=(8, 6))
-        plt.barh(features, values, color=colors, height=0.6)
-        plt.axvline(0, color='black', linewidth=0.8, linestyle='--')
-
-        plt.title('Factores de Influencia en la Decisión', fontsize=12)
-        plt.xlabel('Impacto en el Riesgo (← Seguro | Fraude →)', fontsize=10)
-        plt.yticks(fontsize=9)
-
-        plt.grid(axis='x', linestyle=':', alpha=0.5)
-        plt.subplots_adjust(left=0.30, right=0.95, top=0.9, bottom=0.15)
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', transparent=True, dpi=100)
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        plt.close()
-
-        # ------------------------------------------------------------------
-        # 4. Generación de texto explicativo (alineado al FE real)
-        # ------------------------------------------------------------------
-        text_parts = []
-
-        if monto > 1000:
-            text_parts.append("el monto es elevado en relación al comportamiento típico del sistema")
-
-        if hora in [23, 0, 1, 2, 3, 4, 5]:
-            text_parts.append(f"la operación ocurre en un patrón horario atípico ({hora}:00 hrs)")
-
-        if antiguedad <= 2:
-            text_parts.append("la cuenta pertenece a un grupo de clientes nuevos")
-
-        if text_parts:
-            explanation_text = (
-                "⚠️ Factores de Riesgo Detectados: "
-                "La alerta se genera principalmente porque "
-                + " y ".join(text_parts)
-                + ".\n\n"
-                "ℹ️ Nota: Esta explicación es una aproximación interpretativa "
-                "basada en patrones generales aprendidos por el modelo, "
-                "y no corresponde a los pesos matemáticos internos exactos."
-            )
-        else:
-            explanation_text = (
-                "✅ Factores de Seguridad: "
-                "La transacción presenta un patrón consistente con el comportamiento esperado "
-                "para clientes similares, sin señales claras de riesgo inmediato.\n\n"
-                "ℹ️ Nota: Esta explicación resume factores generales y no representa "
-                "directamente los cálculos internos del modelo."
-            )
+        # Extracción de variables crudas (las únicas disponibles en la app)
+        buckets, explanation_text = _leer_campos(data_dict)
+        image_base64 = get_chart(buckets)
 
         return image_base64, explanation_text
 
@@ -151,3 +323,70 @@ def generate_explanation(data_dict):
         logger.error(f"Error SHAP: {e}")
         return "", "No se pudo generar el gráfico explicativo."
 
+def generate_explanation_text(data_dict):
+    """Solo el texto explicativo (modo explain=text): no toca matplotlib ni la caché."""
+    try:
+        return _leer_campos(data_dict)[1]
+    except Exception as e:
+        logger.error(f"Error SHAP: {e}")
+        return "No se pudo generar el texto explicativo."
+
+# ==============================================================================
+# RENDERIZADO FUERA DEL EVENT LOOP
+# ==============================================================================
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "32"))
+RENDER_TIMEOUT_S = float(os.getenv("RENDER_TIMEOUT_S", "2.0"))
+
+_RENDER_EXECUTOR = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+_PENDING = {"count": 0}
+_PENDING_LOCK = threading.Lock()
+
+async def generate_explanation_async(data_dict):
+    """
+    Versión para el event loop de generate_explanation.
+
+    Si el gráfico ya está en caché se responde sin salir del loop. Si no, se
+    renderiza en el pool de hilos con una cola acotada (RENDER_MAX_PENDING) y
+    un timeout (RENDER_TIMEOUT_S). Si la cola está llena o se agota el tiempo,
+    se devuelve solo el texto; el render en curso igual termina y llena la caché.
+    """
+    try:
+        buckets, explanation_text = _leer_campos(data_dict)
+    except Exception as e:
+        logger.error(f"Error SHAP: {e}")
+        return "", "No se pudo generar el gráfico explicativo."
+
+    with _CACHE_LOCK:
+        image_base64 = _CHART_CACHE.get(buckets)
+        if image_base64 is not None:
+            _CACHE_STATS["hits"] += 1
+            return image_base64, explanation_text
+
+    with _PENDING_LOCK:
+        if _PENDING["count"] >= RENDER_MAX_PENDING:
+            logger.warning("⚠️ Cola de renderizado llena, se omite el gráfico.")
+            return "", explanation_text
+        _PENDING["count"] += 1
+
+    def _release(_):
+        with _PENDING_LOCK:
+            _PENDING["count"] -= 1
+
+    # Se copia el contexto para que los tiempos de render lleguen al Server-Timing del request
+    future = _RENDER_EXECUTOR.submit(contextvars.copy_context().run, get_chart, buckets)
+    future.add_done_callback(_release)
+
+    try:
+        # shield: si se agota el tiempo, el render sigue y llena la caché igual
+        image_base64 = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), RENDER_TIMEOUT_S
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ Render del gráfico superó {RENDER_TIMEOUT_S}s, se omite.")
+        return "", explanation_text
+    except Exception as e:
+        logger.error(f"Error SHAP: {e}")
+        return "", explanation_text
+
+    return image_base64, explanation_text
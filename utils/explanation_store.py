@@ -0,0 +1,58 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Cuánto tiempo se puede pedir la explicación de una predicción y cuántas se retienen
+EXPLANATION_TTL_S = float(os.getenv("EXPLANATION_TTL_S", "600"))
+EXPLANATION_STORE_MAX = int(os.getenv("EXPLANATION_STORE_MAX", "10000"))
+
+# =========================================================
+# ALMACÉN DE CORTA VIDA PARA /explain/{id}
+# =========================================================
+class ExplanationStore:
+    """
+    Guarda los datos de entrada de cada predicción por prediction_id para
+    generar su explicación más tarde. No guarda imágenes: el gráfico sale de
+    la caché por buckets de explainability, así que cada entrada pesa poco.
+
+    Las entradas vencen a los `ttl_s` segundos y, si se supera `max_entries`,
+    se descartan las más antiguas.
+    """
+
+    def __init__(self, ttl_s=EXPLANATION_TTL_S, max_entries=EXPLANATION_STORE_MAX):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # id -> (expira_en, input_dict)
+        self._lock = threading.Lock()
+
+    def put(self, prediction_id, input_dict):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[prediction_id] = (now + self.ttl_s, dict(input_dict))
+            self._entries.move_to_end(prediction_id)
+            self._purge(now)
+
+    def get(self, prediction_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(prediction_id)
+            if entry is None:
+                return None
+            expires_at, input_dict = entry
+            if expires_at <= now:
+                del self._entries[prediction_id]
+                return None
+            return dict(input_dict)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _purge(self, now):
+        # Orden de inserción = orden de vencimiento (TTL fijo)
+        while self._entries:
+            oldest_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_id]
@@ -1,99 +1,661 @@
 import os
-import joblib
-import pandas as pd
+import time
 import numpy as np
 import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import utils.rules as rules
+import utils.metrics as metrics
+import utils.registry as registry
+from utils.velocity import VelocityStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-MODEL_PATH = "model_fraude.pkl"
-_MODEL_PIPELINE = None
+MODEL_PATH = "model_fraude.pkl"  # Se usa si el registro (models/) está vacío
+
+# USE_COMPILED_MODEL=0 fuerza el camino pandas + Pipeline en cada request
+USE_COMPILED_MODEL = os.getenv("USE_COMPILED_MODEL", "1") == "1"
+# Lotes más grandes rinden igual o mejor con el bosque en Cython de sklearn
+COMPILED_MAX_BATCH = int(os.getenv("COMPILED_MAX_BATCH", "1024"))
+# Arranque rápido: carpeta con el modelo exportado como arrays .npy (misc/export_model.py).
+# Si su versión coincide con la que toca cargar, se mapea en memoria y no se
+# importan pandas / sklearn / joblib ni se deserializa el .pkl.
+COMPILED_MODEL_DIR = os.getenv("COMPILED_MODEL_DIR", "")
+# Hilos del bosque en predict_proba (vacío = los que trae el .pkl). serve.py lo
+# fija en núcleos / workers para que varios procesos no sobresuscriban la CPU.
+MODEL_N_JOBS = os.getenv("MODEL_N_JOBS", "")
+# USE_LOOKUP_TABLE=1 precalcula la probabilidad de todo el espacio de entrada
+# discretizado (utils/lookup.py): puntuar pasa a ser leer una celda
+USE_LOOKUP_TABLE = os.getenv("USE_LOOKUP_TABLE", "0") == "1"
+# Diferencia máxima aceptada entre la tabla y el modelo exacto al construirla
+LOOKUP_MAX_ERROR = float(os.getenv("LOOKUP_MAX_ERROR", "1e-9"))
 THRESHOLD = 0.329  # ← usa el umbral óptimo que encontraste
+MEDIUM_THRESHOLD = 0.20  # Desde aquí la transacción pasa a revisión
+
+# Buckets de antigüedad (pd.cut, intervalos cerrados a la derecha)
+TENURE_BINS = [-1, 2, 10, 100]
+TENURE_LABELS = ["New", "Established", "Veteran"]
+
+# Caché de predicciones (PREDICTION_CACHE_SIZE=0 la desactiva)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL_S = float(os.getenv("PREDICTION_CACHE_TTL_S", "300"))
+# Decimales a los que se redondea el monto en la clave (vacío = monto exacto)
+_decimales = os.getenv("PREDICTION_CACHE_AMOUNT_DECIMALS", "")
+PREDICTION_CACHE_AMOUNT_DECIMALS = int(_decimales) if _decimales else None
+
+# Diferencia media máxima aceptada frente al modelo activo al recargar (vacío = sin límite)
+_drift = os.getenv("MODEL_MAX_DRIFT", "")
+MODEL_MAX_DRIFT = float(_drift) if _drift else None
+
+# Velocidad por cuenta (solo si el request trae account_id): umbrales que
+# agregan una alerta y suben un nivel de riesgo. Vacío = regla desactivada.
+def _umbral(nombre, default):
+    valor = os.getenv(nombre, default)
+    return float(valor) if valor else None
+
+VELOCITY_MAX_TX_1M = _umbral("VELOCITY_MAX_TX_1M", "5")
+VELOCITY_MAX_TX_1H = _umbral("VELOCITY_MAX_TX_1H", "30")
+VELOCITY_MAX_CHANNELS_1H = _umbral("VELOCITY_MAX_CHANNELS_1H", "3")
+VELOCITY_MAX_AMOUNT_24H = _umbral("VELOCITY_MAX_AMOUNT_24H", "")
 
 # =========================================================
 # CARGA DEL MODELO
 # =========================================================
-def load_model_assets():
-    global _MODEL_PIPELINE
+class ModeloActivo(NamedTuple):
+    """Todo lo que se reemplaza junto en un swap: una sola referencia global."""
+    pipeline: object  # None en arranque rápido (solo arrays mapeados)
+    compiled: object  # Scorer NumPy equivalente (utils/compiled.py) o None
+    version: str
+    lookup: object = None  # Tabla precalculada (utils/lookup.py) o None
+
+_ACTIVE_MODEL = None
+_RELOAD_LOCK = threading.Lock()
+
+def _resolver_artefacto(version=None):
+    """(ruta, versión) a cargar: la pedida, la última del registro o MODEL_PATH."""
+    if version is None:
+        version = registry.latest_version()
+
+    if version is None:
+        if not os.path.exists(MODEL_PATH):
+            raise FileNotFoundError(f"No existe el modelo en {MODEL_PATH}")
+        return MODEL_PATH, os.path.splitext(os.path.basename(MODEL_PATH))[0]
+
+    return registry.model_path(version), version
+
+def _preparar_modelo(path, version):
+    import joblib
+
+    pipeline = joblib.load(path)
+    if MODEL_N_JOBS:
+        pipeline.steps[-1][1].set_params(n_jobs=int(MODEL_N_JOBS))
+    compiled = _compilar(pipeline) if USE_COMPILED_MODEL else None
+    return ModeloActivo(pipeline, compiled, version)
+
+def _cargar_compilado(version, directory=None):
+    """Modelo desde COMPILED_MODEL_DIR (mmap) si existe y es de `version`; si no, None."""
+    from utils.compiled import load_compiled, read_compiled_meta
+
+    directory = directory or COMPILED_MODEL_DIR
+    meta = read_compiled_meta(directory)
+    if meta is None or meta.get("version") != version:
+        logger.info(f"ℹ️ Sin modelo compilado vigente en {directory} para {version}.")
+        return None
+
+    compiled = load_compiled(directory, mmap_mode="r")
+    logger.info(f"⚡ Arranque rápido: modelo {version} mapeado desde {directory}.")
+    return ModeloActivo(None, compiled, version)
+
+def _cargar_compilado_o_exportar(path, version):
+    """
+    Recarga con COMPILED_MODEL_DIR: la versión nueva se exporta a
+    COMPILED_MODEL_DIR/<versión> (si otro worker no lo hizo ya) y se mapea
+    desde ahí, así los workers siguen compartiendo una sola copia. Nunca se
+    sobrescribe la carpeta que otros procesos tienen mapeada.
+    """
+    from utils.compiled import save_compiled
+
+    modelo = _cargar_compilado(version)
+    if modelo is not None:
+        return modelo
+
+    directory = os.path.join(COMPILED_MODEL_DIR, version)
+    modelo = _cargar_compilado(version, directory)
+    if modelo is not None:
+        return modelo
+
+    exportado = _preparar_modelo(path, version)
+    if exportado.compiled is None:
+        return exportado
+    save_compiled(exportado.compiled, directory, version=version)
+    logger.info(f"✅ Modelo {version} exportado a {directory}")
+    return _cargar_compilado(version, directory)
+
+def _cargar_reglas():
+    global RULE_TABLE
+    try:
+        RULE_TABLE = rules.load_rule_table()
+    except Exception as e:
+        # Sin pre-filtro todo pasa por el modelo: más lento, pero correcto
+        RULE_TABLE = None
+        logger.error(f"⚠️ Reglas inválidas en {rules.RULES_PATH}, pre-filtro desactivado: {e}")
+
+def load_model_assets(version=None):
+    global _ACTIVE_MODEL
+
+    path, version = _resolver_artefacto(version)
+
+    modelo = None
+    if COMPILED_MODEL_DIR and USE_COMPILED_MODEL:
+        modelo = _cargar_compilado(version)
+    _ACTIVE_MODEL = _agregar_tabla(modelo or _preparar_modelo(path, version))
+    logger.info(f"✅ Modelo cargado correctamente ({version}).")
+
+    _cargar_reglas()
+
+    # Las probabilidades cacheadas pertenecen al modelo anterior
+    _PREDICTION_CACHE.clear()
+
+def export_compiled_model(directory, version=None):
+    """Compila la versión indicada (o la vigente) y la guarda como arrays .npy."""
+    from utils.compiled import save_compiled
+
+    path, version = _resolver_artefacto(version)
+    modelo = _preparar_modelo(path, version)
+    if modelo.compiled is None:
+        raise ValueError(f"El modelo {version} no se pudo compilar con paridad")
+
+    save_compiled(modelo.compiled, directory, version=version)
+    logger.info(f"✅ Modelo {version} exportado a {directory}")
+    return version
 
-    if not os.path.exists(MODEL_PATH):
-        raise FileNotFoundError(f"No existe el modelo en {MODEL_PATH}")
+def get_model_version():
+    return _ACTIVE_MODEL.version if _ACTIVE_MODEL is not None else None
 
-    _MODEL_PIPELINE = joblib.load(MODEL_PATH)
-    logger.info("✅ Modelo cargado correctamente.")
+def reload_model(version=None):
+    """
+    Recarga sin cortar el servicio: el modelo nuevo se carga, se calienta con
+    transacciones sintéticas y se valida mientras el actual sigue atendiendo.
+    Recién entonces se reemplaza la referencia global (asignación atómica).
+    Lanza ValueError si el candidato no pasa la validación.
+    """
+    global _ACTIVE_MODEL
+    from utils.compiled import generar_muestras
+
+    with _RELOAD_LOCK:
+        inicio = time.perf_counter()
+        path, version = _resolver_artefacto(version)
+        if COMPILED_MODEL_DIR and USE_COMPILED_MODEL:
+            candidato = _cargar_compilado_o_exportar(path, version)
+        else:
+            candidato = _preparar_modelo(path, version)
+        candidato = _agregar_tabla(candidato)
+
+        # Calentamiento + sanidad de las probabilidades
+        muestras = generar_muestras(n=200, seed=1)
+        nuevas = np.asarray(_score(muestras, candidato), dtype=np.float64)
+        if not np.all(np.isfinite(nuevas)) or nuevas.min() < 0 or nuevas.max() > 1:
+            raise ValueError(f"El modelo {version} produce probabilidades inválidas")
+
+        anterior = _ACTIVE_MODEL
+        drift = None
+        if anterior is not None:
+            previas = np.asarray(_score(muestras, anterior), dtype=np.float64)
+            drift = float(np.mean(np.abs(nuevas - previas)))
+            if MODEL_MAX_DRIFT is not None and drift > MODEL_MAX_DRIFT:
+                raise ValueError(
+                    f"El modelo {version} difiere demasiado del activo (drift medio {drift:.4f} > {MODEL_MAX_DRIFT})"
+                )
+
+        _ACTIVE_MODEL = candidato
+        _PREDICTION_CACHE.clear()
+
+        logger.info(f"✅ Modelo recargado: {anterior.version if anterior else None} -> {version}")
+
+        return {
+            "previous_version": anterior.version if anterior else None,
+            "model_version": version,
+            "compiled": candidato.compiled is not None,
+            "lookup_table": candidato.lookup is not None,
+            "mean_abs_drift": drift,
+            "load_seconds": round(time.perf_counter() - inicio, 3),
+        }
+
+def _compilar(pipeline):
+    """Compila el Pipeline a arrays NumPy y valida paridad; None si no es posible."""
+    from utils.compiled import compile_pipeline, verificar_paridad, PARITY_TOLERANCE
+
+    try:
+        compiled = compile_pipeline(pipeline)
+        max_diff = verificar_paridad(pipeline, compiled)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo compilar el modelo, se usará el Pipeline: {e}")
+        return None
+
+    if max_diff > PARITY_TOLERANCE:
+        logger.warning(f"⚠️ Modelo compilado sin paridad (máx. diff {max_diff:.2e}), se usará el Pipeline.")
+        return None
+
+    logger.info(f"✅ Modelo compilado a NumPy (máx. diff vs Pipeline: {max_diff:.2e}).")
+    return compiled
+
+def _agregar_tabla(modelo):
+    """Con USE_LOOKUP_TABLE, agrega la tabla precalculada si su error está dentro de LOOKUP_MAX_ERROR."""
+    if not USE_LOOKUP_TABLE:
+        return modelo
+    if modelo.compiled is None:
+        logger.warning("⚠️ USE_LOOKUP_TABLE requiere el modelo compilado; se puntúa sin tabla.")
+        return modelo
+
+    from utils.lookup import build_lookup_table, medir_error
+
+    try:
+        tabla = build_lookup_table(modelo.compiled)
+        tabla.max_abs_error = medir_error(tabla)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo construir la tabla precalculada, se usará el modelo compilado: {e}")
+        return modelo
+
+    if tabla.max_abs_error > LOOKUP_MAX_ERROR:
+        logger.warning(f"⚠️ Tabla precalculada fuera de tolerancia (máx. error {tabla.max_abs_error:.2e}), "
+                       f"se usará el modelo compilado.")
+        return modelo
+
+    info = tabla.info()
+    logger.info(f"✅ Tabla precalculada: {info['cells']:,} celdas ({info['bytes'] / 1e6:.1f} MB) en "
+                f"{info['build_seconds']}s, máx. error vs modelo {tabla.max_abs_error:.2e}.")
+    return modelo._replace(lookup=tabla)
+
+def get_lookup_info():
+    modelo = _ACTIVE_MODEL
+    return modelo.lookup.info() if modelo is not None and modelo.lookup is not None else None
 
 # =========================================================
 # FEATURE ENGINEERING (idéntico al entrenamiento)
 # =========================================================
 def aplicar_feature_engineering_api(df):
+    import pandas as pd
+
     df = df.copy()
 
     df["amount_log"] = np.log1p(df["amount"])
     df["hour_sin"] = np.sin(2 * np.pi * df["hour"] / 24)
     df["hour_cos"] = np.cos(2 * np.pi * df["hour"] / 24)
-    df["is_night"] = df["hour"].apply(lambda x: 1 if (x >= 23 or x <= 5) else 0)
+    df["is_night"] = ((df["hour"] >= 23) | (df["hour"] <= 5)).astype(int)
 
-    bins = [-1, 2, 10, 100]
-    labels = ["New", "Established", "Veteran"]
-    df["tenure_group"] = pd.cut(df["account_age"], bins=bins, labels=labels)
+    df["tenure_group"] = pd.cut(df["account_age"], bins=TENURE_BINS, labels=TENURE_LABELS)
     df["segment_tenure_profile"] = (
         df["customer_segment"] + "_" + df["tenure_group"].astype(str)
     )
 
     return df
 
+# =========================================================
+# CLASIFICACIÓN DE RIESGO
+# =========================================================
+NIVELES = [("LOW", "APPROVE"), ("MEDIUM", "REVIEW"), ("HIGH", "BLOCK")]
+
+def _alertas_velocidad(velocity):
+    """Mensajes de las reglas de velocidad que se superaron."""
+    reglas = [
+        ("count_1m", VELOCITY_MAX_TX_1M, "{:.0f} transacciones de la cuenta en el último minuto"),
+        ("count_1h", VELOCITY_MAX_TX_1H, "{:.0f} transacciones de la cuenta en la última hora"),
+        ("channels_1h", VELOCITY_MAX_CHANNELS_1H, "{:.0f} canales distintos en la última hora"),
+        ("amount_24h", VELOCITY_MAX_AMOUNT_24H, "Monto acumulado de {:,.2f} en 24 horas"),
+    ]
+    return [
+        f"⚠️ {mensaje.format(velocity[clave])}"
+        for clave, limite, mensaje in reglas
+        if limite is not None and velocity[clave] >= limite
+    ]
+
+def _construir_resultado(prob_fraude, model_version=None, velocity=None, decision=None):
+    """
+    Traduce una probabilidad al diccionario de respuesta que consume app.py.
+    Con `decision` (APPROVE / BLOCK de una regla) no hay probabilidad: el
+    nivel sale de la acción y probability_percent queda en None.
+    """
+    prob_fraude = float(prob_fraude) if decision is None else None
+
+    if decision is not None:
+        nivel = [accion for _, accion in NIVELES].index(decision)
+    elif prob_fraude < MEDIUM_THRESHOLD:
+        nivel = 0
+    elif prob_fraude < THRESHOLD:
+        nivel = 1
+    else:
+        nivel = 2
+
+    # Una ráfaga en la cuenta sube un nivel (LOW -> MEDIUM -> HIGH)
+    alertas = _alertas_velocidad(velocity) if velocity else []
+    if alertas:
+        nivel = min(nivel + 1, 2)
+
+    risk_level, action = NIVELES[nivel]
+    is_fraud = action == "BLOCK"
+
+    resultado = {
+        "probability_percent": round(prob_fraude * 100, 2) if prob_fraude is not None else None,
+        "is_fraud": is_fraud,
+        "risk_score_input": int(prob_fraude * 100) if prob_fraude is not None else None,
+        "alert_messages": [f"Nivel de riesgo: {risk_level}"] + alertas,
+        "action": action,
+        "risk_level": risk_level,
+        "threshold_used": THRESHOLD,
+        "model_version": model_version
+    }
+    if velocity:
+        resultado["velocity"] = velocity
+    return resultado
+
+def clasificar_riesgo(probs):
+    """Versión vectorizada de _construir_resultado: (risk_level, action) por fila."""
+    probs = np.asarray(probs, dtype=np.float64)
+    niveles = np.select([probs < MEDIUM_THRESHOLD, probs < THRESHOLD], ["LOW", "MEDIUM"], "HIGH")
+    acciones = np.select([probs < MEDIUM_THRESHOLD, probs < THRESHOLD], ["APPROVE", "REVIEW"], "BLOCK")
+    return niveles, acciones
+
+def _resultado_error():
+    return {
+        "probability_percent": 0.0,
+        "is_fraud": False,
+        "risk_score_input": 0,
+        "alert_messages": ["Error en inferencia"],
+    }
+
+# =========================================================
+# CACHÉ DE PREDICCIONES
+# =========================================================
+class PredictionCache:
+    """LRU con vencimiento por TTL: clave de features efectivas -> probabilidad."""
+
+    def __init__(self, max_size, ttl_s):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # clave -> (expira_en, probabilidad)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, prob = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return prob
+
+    def put(self, key, prob):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, prob)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+_PREDICTION_CACHE = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_S)
+
+def _tenure_label(account_age):
+    # Mismo criterio que pd.cut(bins=TENURE_BINS): intervalos (a, b]
+    for lower, upper, label in zip(TENURE_BINS, TENURE_BINS[1:], TENURE_LABELS):
+        if lower < account_age <= upper:
+            return label
+    return "nan"
+
+def _cache_key(input_data: dict, model_version):
+    """
+    Tupla con lo que el modelo realmente ve: la antigüedad solo entra como
+    tenure_group, así que dos cuentas del mismo bucket comparten clave.
+    Incluye la versión para que un swap en curso nunca mezcle modelos.
+    """
+    amount = float(input_data["amount"])
+    if PREDICTION_CACHE_AMOUNT_DECIMALS is not None:
+        amount = round(amount, PREDICTION_CACHE_AMOUNT_DECIMALS)
+    return (
+        model_version,
+        amount,
+        int(input_data["hour"]),
+        _tenure_label(float(input_data["account_age"])),
+        input_data["transaction_type"],
+        input_data["customer_segment"],
+    )
+
+# Pre-filtro de reglas compilado (utils/rules.py); None = todo pasa por el modelo
+RULE_TABLE = None
+
+# Ventanas por cuenta en memoria del proceso (utils/velocity.py)
+VELOCITY_STORE = VelocityStore()
+
+# Challenger en modo sombra (utils/shadow.py); None = apagado
+SHADOW_SCORER = None
+
+def get_prediction_cache_stats():
+    return _PREDICTION_CACHE.snapshot()
+
+def _metricas_cache():
+    stats = _PREDICTION_CACHE.snapshot()
+    return {
+        f"fraudguard_prediction_cache_{nombre}_total": (
+            "counter", f"Caché de predicciones: {nombre}.", {(): stats[nombre]}
+        )
+        for nombre in ("hits", "misses", "evictions", "expirations")
+    }
+
+metrics.register_collector(_metricas_cache)
+
+# =========================================================
+# EVALUACIÓN DEL MODELO
+# =========================================================
+def _score(input_list: list, modelo: ModeloActivo):
+    """Probabilidades de fraude para una lista de transacciones (sin caché)."""
+    if modelo.lookup is not None:
+        from utils.compiled import _columnas_crudas
+
+        with metrics.timed("feature_engineering"):
+            raw = _columnas_crudas(input_list)
+            celdas = modelo.lookup.celdas(raw)
+        with metrics.timed("predict_proba"):
+            return modelo.lookup.predict_proba_celdas(celdas, raw)
+
+    if modelo.compiled is not None and (
+        modelo.pipeline is None or len(input_list) <= COMPILED_MAX_BATCH
+    ):
+        from utils.compiled import _columnas_crudas
+
+        with metrics.timed("feature_engineering"):
+            X = modelo.compiled.transform(_columnas_crudas(input_list))
+        with metrics.timed("predict_proba"):
+            return modelo.compiled.predict_proba_matrix(X)
+
+    import pandas as pd
+
+    with metrics.timed("feature_engineering"):
+        df_processed = aplicar_feature_engineering_api(pd.DataFrame(input_list))
+    with metrics.timed("predict_proba"):
+        return modelo.pipeline.predict_proba(df_processed)[:, 1]
+
+def _score_medido(input_list, modelo, tiempos):
+    if tiempos is None:
+        return _score(input_list, modelo)
+    inicio = time.perf_counter()
+    probs = _score(input_list, modelo)
+    tiempos.append((time.perf_counter() - inicio, len(input_list)))
+    return probs
+
+def _score_cached(input_list: list, modelo: ModeloActivo, tiempos=None):
+    """
+    Igual que _score, pero solo evalúa el modelo para las claves no cacheadas.
+    Si se pasa `tiempos` (lista), se le agrega (segundos, filas) de cada
+    evaluación real del modelo: los aciertos de caché no cuentan.
+    """
+    # Con la tabla precalculada, armar la clave cuesta más que leer la celda
+    if PREDICTION_CACHE_SIZE <= 0 or modelo.lookup is not None:
+        return list(_score_medido(input_list, modelo, tiempos))
+
+    keys = [_cache_key(item, modelo.version) for item in input_list]
+    probs = [_PREDICTION_CACHE.get(key) for key in keys]
+
+    # Claves repetidas dentro del mismo lote se evalúan una sola vez
+    missing = {}
+    for i, prob in enumerate(probs):
+        if prob is None:
+            missing.setdefault(keys[i], []).append(i)
+
+    if missing:
+        scored = _score_medido([input_list[indices[0]] for indices in missing.values()], modelo, tiempos)
+        for (key, indices), prob in zip(missing.items(), scored):
+            _PREDICTION_CACHE.put(key, float(prob))
+            for i in indices:
+                probs[i] = float(prob)
+
+    return probs
+
+def predict_frame(df):
+    """
+    Probabilidades para un DataFrame con las columnas crudas (scoring offline).
+    Sin caché ni diccionarios por fila: una pasada vectorizada por bloque.
+    """
+    modelo = _modelo_activo()
+    usa_tabla = modelo.lookup is not None
+    if usa_tabla or (modelo.compiled is not None and (modelo.pipeline is None or len(df) <= COMPILED_MAX_BATCH)):
+        raw = {
+            "amount": df["amount"].to_numpy(dtype=np.float64),
+            "hour": df["hour"].to_numpy(dtype=np.float64),
+            "account_age": df["account_age"].to_numpy(dtype=np.float64),
+            "transaction_type": df["transaction_type"].to_numpy(dtype=object),
+            "customer_segment": df["customer_segment"].to_numpy(dtype=object),
+        }
+        if usa_tabla:
+            return modelo.lookup.predict_proba_raw(raw)
+        return modelo.compiled.predict_proba_matrix(modelo.compiled.transform(raw))
+
+    return modelo.pipeline.predict_proba(aplicar_feature_engineering_api(df))[:, 1]
+
 # =========================================================
 # FUNCIÓN COMPATIBLE CON app.py
 # =========================================================
-def predict(input_data: dict):
-    global _MODEL_PIPELINE
+def _registrar_velocidad(input_data):
+    account_id = input_data.get("account_id")
+    if account_id is None:
+        return None
+    return VELOCITY_STORE.record(account_id, input_data["amount"], input_data["transaction_type"])
 
-    if _MODEL_PIPELINE is None:
+def _modelo_activo():
+    # Una sola lectura de la referencia global: el request usa un modelo coherente
+    if _ACTIVE_MODEL is None:
         load_model_assets()
+    return _ACTIVE_MODEL
 
-    try:
-        df_raw = pd.DataFrame([input_data])
-        df_processed = aplicar_feature_engineering_api(df_raw)
+def _resultado_regla(decision, regla, model_version, velocity):
+    """Resultado de una transacción que resolvió el pre-filtro, sin probabilidad del modelo."""
+    metrics.RULE_DECISIONS.inc(regla, decision)
+    resultado = _construir_resultado(None, model_version, velocity, decision=decision)
+    resultado["alert_messages"].append(f"Decidido por la regla '{regla}' (sin evaluar el modelo)")
+    resultado["decided_by"] = f"rule:{regla}"
+    return resultado
 
-        prob_fraude = _MODEL_PIPELINE.predict_proba(df_processed)[0, 1]
+def _evaluar(input_list, modelo):
+    """Velocidad por cuenta, pre-filtro de reglas y modelo solo para lo que quedó sin decidir."""
+    velocidades = [_registrar_velocidad(item) for item in input_list]
 
-        # -----------------------------
-        # CLASIFICACIÓN DE RIESGO
-        # -----------------------------
-        if prob_fraude < 0.20:
-            risk_level = "LOW"
-            action = "APPROVE"
+    # Una cuenta con alertas de velocidad no es un caso claro: siempre va al modelo
+    tabla = RULE_TABLE
+    decisiones = [
+        tabla.decide(item) if tabla is not None and not (v and _alertas_velocidad(v)) else None
+        for item, v in zip(input_list, velocidades)
+    ]
 
-        elif prob_fraude < THRESHOLD:
-            risk_level = "MEDIUM"
-            action = "REVIEW"
+    pendientes = [item for item, decision in zip(input_list, decisiones) if decision is None]
+    shadow = SHADOW_SCORER
+    tiempos = [] if shadow is not None else None
+    probs_modelo = _score_cached(pendientes, modelo, tiempos) if pendientes else []
 
+    # El challenger solo recibe lo que decidió el modelo; submit() no espera su resultado
+    if shadow is not None and pendientes:
+        shadow.submit(pendientes, probs_modelo, modelo.version, tiempos[0] if tiempos else None)
+
+    probs = iter(probs_modelo)
+
+    resultados = []
+    for decision, velocity in zip(decisiones, velocidades):
+        if decision is not None:
+            resultados.append(_resultado_regla(*decision, modelo.version, velocity))
         else:
-            risk_level = "HIGH"
-            action = "BLOCK"
+            resultado = _construir_resultado(next(probs), modelo.version, velocity)
+            resultado["decided_by"] = "model"
+            resultados.append(resultado)
+    return resultados
 
-        is_fraud = action == "BLOCK"
+def predict(input_data: dict):
+    try:
+        modelo = _modelo_activo()
+        resultado = _evaluar([input_data], modelo)[0]
 
-        logger.info(
-            f"Probabilidad: {prob_fraude:.4f} | Nivel: {risk_level} | Bloqueo: {is_fraud}"
+        logger.debug(
+            f"Probabilidad: {resultado['probability_percent']}% | Nivel: {resultado['risk_level']} | "
+            f"Bloqueo: {resultado['is_fraud']} | Origen: {resultado['decided_by']}"
         )
 
-        return {
-            "probability_percent": round(prob_fraude * 100, 2),
-            "is_fraud": is_fraud,
-            "risk_score_input": int(prob_fraude * 100),
-            "alert_messages": [f"Nivel de riesgo: {risk_level}"],
-            "action": action,
-            "risk_level": risk_level,
-            "threshold_used": THRESHOLD
-        }
+        return resultado
 
     except Exception as e:
+        metrics.ERRORS.inc("inference")
         logger.error(f"Error en inferencia: {e}")
-        return {
-            "probability_percent": 0.0,
-            "is_fraud": False,
-            "risk_score_input": 0,
-            "alert_messages": ["Error en inferencia"],
-        }
+        return _resultado_error()
+
+# =========================================================
+# PREDICCIÓN POR LOTES
+# =========================================================
+def predict_batch(input_list: list):
+    """
+    Puntúa una lista de transacciones con una única pasada de feature
+    engineering y una única evaluación del modelo (compilado o Pipeline)
+    para las que no estén en caché ni las haya resuelto el pre-filtro de reglas.
+    Devuelve una lista de resultados en el mismo orden de entrada.
+
+    Cada resultado trae en `stage_timings` los tiempos de etapa del lote
+    completo (compartidos), para que el llamador los sume a su request.
+    """
+    if not input_list:
+        return []
+
+    try:
+        with metrics.capture() as timings:
+            modelo = _modelo_activo()
+            resultados = _evaluar(input_list, modelo)
+
+        logger.debug(f"Lote puntuado: {len(resultados)} transacciones")
+
+        for resultado in resultados:
+            resultado["stage_timings"] = timings
+        return resultados
+
+    except Exception as e:
+        metrics.ERRORS.inc("inference")
+        logger.error(f"Error en inferencia por lotes: {e}")
+        return [_resultado_error() for _ in input_list]
@@ -0,0 +1,210 @@
+import time
+import logging
+import numpy as np
+
+from utils.inference import TENURE_BINS, TENURE_LABELS
+from utils.compiled import generar_muestras, _columnas_crudas
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HORAS = 24
+
+# =========================================================
+# TABLA DE PROBABILIDADES PRECALCULADA
+# =========================================================
+# Fuera del monto, todo lo que ve el bosque es de baja cardinalidad: hora (24),
+# tipo de transacción, segmento y grupo de antigüedad (account_age solo entra
+# como tenure_group). El monto entra únicamente como amount_log, y el bosque
+# es constante entre dos umbrales consecutivos de amount_log. Tomando como
+# cortes de la grilla de montos los umbrales del propio bosque, la tabla
+# reproduce el modelo exacto: puntuar es calcular un índice y leer una celda,
+# sin importar cuántos árboles tenga el bosque.
+
+# Representante de account_age por grupo (intervalos (a, b]); el último
+# grupo es "fuera de rango" (pd.cut -> NaN -> one-hot en cero)
+_EDADES = [float(b) for b in TENURE_BINS[1:]] + [float(TENURE_BINS[-1]) + 1]
+_TENURE_BINS = np.asarray(TENURE_BINS, dtype=np.float64)
+# searchsorted sobre TENURE_BINS -> índice de grupo (0 y len(bins) = fuera de rango)
+_FUERA_DE_RANGO = len(TENURE_LABELS)
+_GRUPO = np.array([_FUERA_DE_RANGO] + list(range(len(TENURE_LABELS))) + [_FUERA_DE_RANGO], dtype=np.intp)
+
+class LookupTable:
+    """
+    Probabilidad del bosque para cada (hora, tipo, segmento, grupo de
+    antigüedad, intervalo de amount_log), en un array denso de float64.
+
+    `cortes` son los umbrales de amount_log (ya escalado) de todo el bosque:
+    el intervalo de un monto es la cantidad de cortes menores a su valor en
+    float32, igual que la comparación `x > umbral` de los árboles. Las filas
+    que la tabla no cubre (hora no entera, categorías desconocidas) se
+    puntúan con el modelo compilado.
+    """
+
+    def __init__(self, compiled, table, cortes, tipos, segmentos):
+        self.compiled = compiled
+        self.table = table
+        self.flat = table.reshape(-1)
+        self.cortes = cortes
+        self.tipos = {t: i for i, t in enumerate(tipos)}
+        self.segmentos = {s: i for i, s in enumerate(segmentos)}
+
+        j = compiled.num_columns.index("amount_log")
+        self.amount_mean = float(compiled.scaler_mean[j])
+        self.amount_scale = float(compiled.scaler_scale[j])
+        self.strides = np.array(table.strides, dtype=np.intp) // table.itemsize
+
+        self.build_seconds = None
+        self.max_abs_error = None
+
+    # -----------------------------------------------------
+    # Consulta
+    # -----------------------------------------------------
+    def celdas(self, raw):
+        """Índice plano de la celda de cada fila (-1 si la tabla no la cubre)."""
+        hour = raw["hour"]
+        tipo = np.array([self.tipos.get(v, -1) for v in raw["transaction_type"]], dtype=np.intp)
+        segmento = np.array([self.segmentos.get(v, -1) for v in raw["customer_segment"]], dtype=np.intp)
+        grupo = _GRUPO[np.searchsorted(_TENURE_BINS, raw["account_age"], side="left")]
+
+        # Mismo valor float32 que CompiledModel.transform
+        x = ((np.log1p(raw["amount"]) - self.amount_mean) / self.amount_scale).astype(np.float32)
+        intervalo = np.searchsorted(self.cortes, x.astype(np.float64), side="left")
+
+        hora = hour.astype(np.intp)
+        cubiertas = (
+            (hora == hour) & (hora >= 0) & (hora < HORAS) & (tipo >= 0) & (segmento >= 0) & ~np.isnan(x)
+        )
+        indice = (
+            hora * self.strides[0] + tipo * self.strides[1] + segmento * self.strides[2]
+            + grupo * self.strides[3] + intervalo * self.strides[4]
+        )
+        return np.where(cubiertas, indice, -1)
+
+    def predict_proba_celdas(self, celdas, raw):
+        probs = self.flat[np.maximum(celdas, 0)]
+        faltantes = celdas < 0
+        if faltantes.any():
+            resto = {k: v[faltantes] for k, v in raw.items()}
+            probs[faltantes] = self.compiled.predict_proba_matrix(self.compiled.transform(resto))
+        return probs
+
+    def predict_proba_raw(self, raw):
+        return self.predict_proba_celdas(self.celdas(raw), raw)
+
+    def predict_proba_records(self, records):
+        return self.predict_proba_raw(_columnas_crudas(records))
+
+    def info(self):
+        return {
+            "shape": list(self.table.shape),
+            "cells": int(self.table.size),
+            "amount_bins": int(self.table.shape[-1]),
+            "bytes": int(self.table.nbytes),
+            "build_seconds": self.build_seconds,
+            "max_abs_error": self.max_abs_error,
+        }
+
+# =========================================================
+# CONSTRUCCIÓN DESDE EL MODELO COMPILADO
+# =========================================================
+def _categorias(compiled):
+    """Tipos de transacción y segmentos que conoce el one-hot del modelo."""
+    columnas = dict(zip(compiled.meta["cat_columns"], compiled.meta["categories"]))
+    if set(columnas) != {"transaction_type", "segment_tenure_profile"}:
+        raise ValueError(f"Columnas categóricas no soportadas: {sorted(columnas)}")
+    if "amount_log" not in compiled.num_columns:
+        raise ValueError("El modelo no usa amount_log")
+
+    tipos = list(columnas["transaction_type"])
+    segmentos = sorted({perfil.rsplit("_", 1)[0] for perfil in columnas["segment_tenure_profile"]})
+    return tipos, segmentos
+
+def _representantes(cortes):
+    """Un float32 por intervalo (cortes[b-1], cortes[b]]: el mayor que no supera cortes[b]."""
+    r = cortes.astype(np.float32)
+    r = np.where(r.astype(np.float64) > cortes, np.nextafter(r, np.float32(-np.inf)), r)
+    return np.append(r, np.float32(np.inf))
+
+def build_lookup_table(compiled):
+    """
+    Evalúa el bosque árbol por árbol solo en los intervalos de monto donde
+    cada árbol cambia de hoja (sus propios umbrales de amount_log), acumula
+    las diferencias en la grilla global y la integra con un cumsum.
+    """
+    inicio = time.perf_counter()
+    tipos, segmentos = _categorias(compiled)
+
+    n_nodos = len(compiled.children)
+    hoja = compiled.children[:, 0] == np.arange(n_nodos)
+    j = compiled.num_offset + compiled.num_columns.index("amount_log")
+    es_corte = (compiled.feature == j) & ~hoja
+    cortes = np.unique(compiled.threshold[es_corte])
+    representantes = _representantes(cortes)
+
+    # Una fila de X por combinación de hora, tipo, segmento y grupo de antigüedad
+    forma = (HORAS, len(tipos), len(segmentos), len(_EDADES))
+    combinaciones = np.indices(forma).reshape(len(forma), -1)
+    n_comb = combinaciones.shape[1]
+    raw = {
+        "amount": np.ones(n_comb),
+        "hour": combinaciones[0].astype(np.float64),
+        "transaction_type": np.array(tipos, dtype=object)[combinaciones[1]],
+        "customer_segment": np.array(segmentos, dtype=object)[combinaciones[2]],
+        "account_age": np.array(_EDADES)[combinaciones[3]],
+    }
+    Xc = compiled.transform(raw)
+
+    diferencias = np.zeros((n_comb, len(cortes) + 1))
+    roots = list(compiled.roots) + [n_nodos]
+    for raiz, fin in zip(roots, roots[1:]):
+        propios = np.unique(compiled.threshold[raiz:fin][es_corte[raiz:fin]])
+        # Primer intervalo global de cada tramo del árbol
+        inicios = np.concatenate([[0], np.searchsorted(cortes, propios) + 1])
+
+        X = np.repeat(Xc[None], len(inicios), axis=0)
+        X[:, :, j] = representantes[inicios][:, None]
+        X = X.reshape(-1, Xc.shape[1])
+
+        filas = np.arange(len(X))
+        node = np.full(len(X), raiz, dtype=np.intp)
+        for _ in range(compiled.max_depth):
+            go_right = X[filas, compiled.feature[node]] > compiled.threshold[node]
+            node = compiled.children[node, go_right.view(np.int8)]
+
+        valores = compiled.leaf_proba[node].reshape(len(inicios), n_comb)
+        diferencias[:, inicios] += np.diff(valores, axis=0, prepend=0.0).T
+
+    table = (np.cumsum(diferencias, axis=1) / len(compiled.roots)).reshape(*forma, len(cortes) + 1)
+
+    tabla = LookupTable(compiled, table, cortes, tipos, segmentos)
+    tabla.build_seconds = round(time.perf_counter() - inicio, 3)
+    return tabla
+
+# =========================================================
+# COTA DE ERROR FRENTE AL MODELO EXACTO
+# =========================================================
+def _montos_en_los_cortes(tabla, n=2000, seed=0):
+    """Montos justo en cada corte y a ambos lados (donde un error de índice se notaría)."""
+    rng = np.random.default_rng(seed)
+    x = np.concatenate([
+        tabla.cortes,
+        np.nextafter(tabla.cortes.astype(np.float32), np.float32(np.inf)).astype(np.float64),
+        np.nextafter(tabla.cortes.astype(np.float32), np.float32(-np.inf)).astype(np.float64),
+    ])
+    montos = np.expm1(x * tabla.amount_scale + tabla.amount_mean)
+    montos = montos[np.isfinite(montos) & (montos > 0)]
+    return rng.choice(montos, size=min(n, len(montos)), replace=False)
+
+def medir_error(tabla, records=None):
+    """Máxima diferencia absoluta frente al modelo compilado (muestras + montos en los cortes)."""
+    if records is None:
+        records = generar_muestras(n=2000)
+        extremos = generar_muestras(n=len(_montos_en_los_cortes(tabla)), seed=1)
+        for registro, monto in zip(extremos, _montos_en_los_cortes(tabla)):
+            registro["amount"] = float(monto)
+        records = records + extremos
+
+    raw = _columnas_crudas(records)
+    esperado = tabla.compiled.predict_proba_matrix(tabla.compiled.transform(raw))
+    return float(np.max(np.abs(esperado - tabla.predict_proba_raw(raw))))
@@ -0,0 +1,171 @@
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# =========================================================
+# MÉTRICAS EN FORMATO PROMETHEUS (sin dependencias externas)
+# =========================================================
+# Buckets de latencia en segundos: de 50 µs a 5 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _formatear_labels(labelnames, values, extra=()):
+    pares = list(zip(labelnames, values)) + list(extra)
+    if not pares:
+        return ""
+    cuerpo = ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in pares)
+    return "{" + cuerpo + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lineas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lineas.append(f"{self.name}{_formatear_labels(self.labelnames, labels)} {value}")
+        return lineas
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [conteos por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(labels)
+            if serie is None:
+                serie = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if idx < len(self.buckets):
+                serie[idx] += 1
+            serie[-2] += value
+            serie[-1] += 1
+
+    def render(self):
+        lineas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, serie in sorted(self._series.items()):
+                acumulado = 0
+                for limite, conteo in zip(self.buckets, serie):
+                    acumulado += conteo
+                    etiquetas = _formatear_labels(self.labelnames, labels, [("le", limite)])
+                    lineas.append(f"{self.name}_bucket{etiquetas} {acumulado}")
+                etiquetas = _formatear_labels(self.labelnames, labels, [("le", "+Inf")])
+                lineas.append(f"{self.name}_bucket{etiquetas} {serie[-1]}")
+                etiquetas = _formatear_labels(self.labelnames, labels)
+                lineas.append(f"{self.name}_sum{etiquetas} {serie[-2]}")
+                lineas.append(f"{self.name}_count{etiquetas} {serie[-1]}")
+        return lineas
+
+# =========================================================
+# MÉTRICAS DEL SERVICIO
+# =========================================================
+STAGE_SECONDS = Histogram(
+    "fraudguard_stage_seconds",
+    "Duración de cada etapa del camino caliente (validation, feature_engineering, "
+    "predict_proba, chart_render, base64_encode, mongo_write, mongo_read).",
+    labelnames=("stage",),
+)
+PREDICTIONS = Counter("fraudguard_predictions_total", "Predicciones servidas por nivel de riesgo.",
+                      labelnames=("endpoint", "risk_level"))
+ERRORS = Counter("fraudguard_errors_total", "Errores por componente.", labelnames=("component",))
+RULE_DECISIONS = Counter("fraudguard_rule_decisions_total", "Transacciones resueltas por el pre-filtro de reglas.",
+                         labelnames=("rule", "decision"))
+
+_METRICAS = [STAGE_SECONDS, PREDICTIONS, ERRORS, RULE_DECISIONS]
+
+# Colectores evaluados al scrapear: callable -> {nombre: (tipo, ayuda, {labels: valor})}
+_COLECTORES = []
+
+def register_collector(fn):
+    _COLECTORES.append(fn)
+
+def render_prometheus():
+    lineas = []
+    for metrica in _METRICAS:
+        lineas.extend(metrica.render())
+    for colector in _COLECTORES:
+        try:
+            familias = colector()
+        except Exception:
+            continue
+        for nombre, (tipo, ayuda, muestras) in familias.items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for labels, valor in muestras.items():
+                lineas.append(f"{nombre}{_formatear_labels([k for k, _ in labels], [v for _, v in labels])} {valor}")
+    return "\n".join(lineas) + "\n"
+
+# =========================================================
+# TIEMPOS POR REQUEST (header Server-Timing)
+# =========================================================
+# El middleware de app.py crea un dict por request; las etapas que corren en
+# el mismo contexto (o en run_in_threadpool, que lo copia) se suman ahí.
+_REQUEST_TIMINGS = contextvars.ContextVar("request_timings", default=None)
+
+def start_request():
+    timings = {"_start": time.perf_counter()}
+    _REQUEST_TIMINGS.set(timings)
+    return timings
+
+def mark_validation():
+    """Llamar al entrar al endpoint: todo lo anterior fue lectura + validación del body."""
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None and "_start" in timings:
+        observe("validation", time.perf_counter() - timings["_start"])
+
+def add_timings(stage_timings):
+    """Suma al request actual tiempos medidos en otro hilo (p. ej. el micro-batcher)."""
+    timings = _REQUEST_TIMINGS.get()
+    if timings is None or not stage_timings:
+        return
+    for stage, seconds in stage_timings.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def capture():
+    """Acumula en un dict propio los tiempos de etapa del bloque (p. ej. un lote compartido)."""
+    timings = {}
+    token = _REQUEST_TIMINGS.set(timings)
+    try:
+        yield timings
+    finally:
+        _REQUEST_TIMINGS.reset(token)
+
+def observe(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Mide el bloque en el histograma y en los tiempos del request actual (si hay)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - inicio)
+
+def server_timing_header(timings):
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.3f}"
+        for stage, seconds in timings.items()
+        if not stage.startswith("_")
+    )
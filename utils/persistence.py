@@ -0,0 +1,285 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+import utils.metrics as metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configuración del escritor en segundo plano
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "500"))
+MONGO_FLUSH_INTERVAL_S = float(os.getenv("MONGO_FLUSH_INTERVAL_S", "1.0"))
+MONGO_QUEUE_MAX = int(os.getenv("MONGO_QUEUE_MAX", "10000"))
+MONGO_SPOOL_PATH = os.getenv("MONGO_SPOOL_PATH", "mongo_spool.jsonl")
+MONGO_RETRY_INTERVAL_S = float(os.getenv("MONGO_RETRY_INTERVAL_S", "10"))
+
+# Pool de conexiones del cliente
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "2000"))
+
+DUPLICATE_KEY = 11000
+
+# =========================================================
+# CLIENTE
+# =========================================================
+def create_client(uri):
+    """MongoClient con pool acotado y timeouts cortos para no colgar el escritor."""
+    from pymongo import MongoClient
+
+    return MongoClient(
+        uri,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_TIMEOUT_MS * 5,
+    )
+
+# =========================================================
+# ESCRITOR EN SEGUNDO PLANO
+# =========================================================
+class MongoWriter:
+    """
+    Persistencia asíncrona para las predicciones.
+
+    `write()` solo encola el documento y vuelve de inmediato. Un hilo de fondo
+    vacía la cola con `insert_many` cada `batch_size` documentos o cada
+    `flush_interval_s` segundos. Si Mongo falla, o la cola está llena, los
+    documentos van a un archivo spool (JSONL extendido de bson) que se
+    reintenta cada `retry_interval_s` segundos.
+
+    `collection` solo necesita `insert_many`, así que sirve una colección
+    real, una de mongomock o un doble de prueba.
+
+    `after_insert(documentos)`, si se indica, recibe los documentos que
+    quedaron insertados en cada escritura (sin los duplicados de un reenvío
+    del spool); lo usa el registro de auditoría para sus rollups.
+    """
+
+    def __init__(self, collection, batch_size=MONGO_BATCH_SIZE, flush_interval_s=MONGO_FLUSH_INTERVAL_S,
+                 max_queue=MONGO_QUEUE_MAX, spool_path=MONGO_SPOOL_PATH,
+                 retry_interval_s=MONGO_RETRY_INTERVAL_S, after_insert=None):
+        self.collection = collection
+        self.after_insert = after_insert
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_s = flush_interval_s
+        self.spool_path = spool_path
+        self.retry_interval_s = retry_interval_s
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_retry = 0.0
+        self.stats = {"written": 0, "spooled": 0, "replayed": 0, "failed_flushes": 0, "bad_lines": 0}
+
+    # -----------------------------------------------------
+    # API pública
+    # -----------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mongo-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"✅ Escritor MongoDB activo (lote {self.batch_size} / {self.flush_interval_s}s, spool: {self.spool_path})"
+        )
+
+    def stop(self, timeout=10.0):
+        """Drena la cola (a Mongo o al spool) y detiene el hilo."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+        # Lo que no alcanzó a salir queda en el spool para el próximo arranque
+        pending = self._drain(self._queue.qsize())
+        if pending:
+            self._spool(pending)
+
+    def write(self, document):
+        """Encola un documento sin bloquear. Devuelve False si tuvo que ir al spool."""
+        try:
+            self._queue.put_nowait(document)
+            return True
+        except queue.Full:
+            self._spool([document])
+            return False
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def adopt(self, paths):
+        """Agrega al spool propio los spools de otros procesos (ver utils/workers.py) y los borra."""
+        for path in paths:
+            try:
+                with self._spool_lock, open(path, encoding="utf-8") as origen, \
+                        open(self.spool_path, "a", encoding="utf-8") as destino:
+                    for line in origen:
+                        destino.write(line if line.endswith("\n") else line + "\n")
+                os.remove(path)
+            except Exception as e:
+                logger.error(f"⚠️ No se pudo adoptar el spool {path}: {e}")
+
+    # -----------------------------------------------------
+    # Hilo de fondo
+    # -----------------------------------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            self._maybe_replay()
+
+        # Vaciado final al apagar
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval_s
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, documents):
+        from pymongo.errors import BulkWriteError
+
+        insertados = documents
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Reintentos del spool: los documentos ya insertados conservan su _id
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            duplicados = {err["index"] for err in errors}
+            insertados = [doc for i, doc in enumerate(documents) if i not in duplicados]
+
+        if self.after_insert is not None and insertados:
+            # Los documentos ya están en Mongo: un fallo acá no debe mandarlos al spool
+            try:
+                self.after_insert(insertados)
+            except Exception as e:
+                metrics.ERRORS.inc("mongo_after_insert")
+                logger.error(f"⚠️ Error en el post-proceso de {len(insertados)} documentos insertados: {e}")
+
+    def _flush(self, batch):
+        try:
+            with metrics.timed("mongo_write"):
+                self._insert(batch)
+            self.stats["written"] += len(batch)
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            metrics.ERRORS.inc("mongo_write")
+            logger.error(f"⚠️ Error escribiendo lote en MongoDB, se envía al spool: {e}")
+            self._spool(batch)
+            self._last_retry = time.monotonic()
+
+    # -----------------------------------------------------
+    # Spool en disco
+    # -----------------------------------------------------
+    def _spool(self, documents):
+        from bson import json_util
+
+        try:
+            with self._spool_lock, open(self.spool_path, "a", encoding="utf-8") as f:
+                for document in documents:
+                    f.write(json_util.dumps(document) + "\n")
+            self.stats["spooled"] += len(documents)
+        except Exception as e:
+            logger.error(f"❌ No se pudo escribir el spool ({len(documents)} documentos perdidos): {e}")
+
+    def _maybe_replay(self):
+        if time.monotonic() - self._last_retry < self.retry_interval_s:
+            return
+        self._last_retry = time.monotonic()
+
+        # Un error acá no puede matar al hilo escritor: el spool se reintenta en la próxima vuelta
+        try:
+            self._replay()
+        except Exception as e:
+            logger.error(f"⚠️ Error reenviando el spool, se reintentará: {e}")
+
+    def _replay(self):
+        # Se renombra antes de leer para que los nuevos desbordes vayan a un spool limpio.
+        # Si quedó un .replay de un intento fallido, se termina ese primero.
+        replay_path = self.spool_path + ".replay"
+        with self._spool_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, replay_path)
+
+        documents = self._leer_replay(replay_path)
+        if documents is None:
+            return
+
+        try:
+            for i in range(0, len(documents), self.batch_size):
+                self._insert(documents[i:i + self.batch_size])
+        except Exception as e:
+            logger.warning(f"⚠️ MongoDB sigue sin responder, el spool se reintentará: {e}")
+            return
+
+        try:
+            os.remove(replay_path)
+        except FileNotFoundError:
+            pass
+        self.stats["replayed"] += len(documents)
+        logger.info(f"✅ Spool reenviado a MongoDB: {len(documents)} documentos")
+
+    def _leer_replay(self, replay_path):
+        """
+        Documentos del .replay (None si ya no existe). Las líneas que no se
+        pueden leer (p. ej. cortadas por un apagado a mitad de escritura) se
+        apartan a <spool>.bad y el .replay se reescribe sin ellas.
+        """
+        from bson import json_util
+
+        documents, invalidas = [], []
+        try:
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        documents.append(json_util.loads(line))
+                    except Exception:
+                        invalidas.append(line if line.endswith("\n") else line + "\n")
+        except FileNotFoundError:
+            return None
+
+        if invalidas:
+            with open(self.spool_path + ".bad", "a", encoding="utf-8") as f:
+                f.writelines(invalidas)
+            tmp_path = replay_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json_util.dumps(document) + "\n" for document in documents)
+            os.replace(tmp_path, replay_path)
+            self.stats["bad_lines"] += len(invalidas)
+            logger.error(f"⚠️ {len(invalidas)} líneas ilegibles del spool apartadas en {self.spool_path}.bad")
+
+        return documents
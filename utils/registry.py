@@ -0,0 +1,79 @@
+import os
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Carpeta con los artefactos versionados: models/<versión>.pkl
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+MODEL_EXTENSION = ".pkl"
+
+# =========================================================
+# REGISTRO DE MODELOS EN DISCO
+# =========================================================
+def list_versions(models_dir=None):
+    """Versiones disponibles, ordenadas de la más antigua a la más nueva."""
+    models_dir = models_dir or MODELS_DIR
+    if not os.path.isdir(models_dir):
+        return []
+    return sorted(
+        name[:-len(MODEL_EXTENSION)]
+        for name in os.listdir(models_dir)
+        if name.endswith(MODEL_EXTENSION) and not name.startswith(".")
+    )
+
+def latest_version(models_dir=None):
+    versions = list_versions(models_dir)
+    return versions[-1] if versions else None
+
+def model_path(version, models_dir=None):
+    models_dir = models_dir or MODELS_DIR
+    path = os.path.join(models_dir, version + MODEL_EXTENSION)
+    # La versión viene de la API: no se permite salir de la carpeta del registro
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(models_dir):
+        raise ValueError(f"Versión inválida: {version}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe la versión {version} en {models_dir}")
+    return path
+
+# =========================================================
+# WATCHER
+# =========================================================
+class ModelWatcher:
+    """
+    Revisa el registro cada `interval_s` segundos y llama a
+    `on_new_version(versión)` cuando aparece un artefacto más nuevo que el
+    último visto. Solo reacciona a versiones nuevas, así que un rollback
+    manual a una versión anterior no se revierte solo.
+    """
+
+    def __init__(self, on_new_version, interval_s, models_dir=None):
+        self.on_new_version = on_new_version
+        self.interval_s = interval_s
+        self.models_dir = models_dir
+        self._last_seen = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._last_seen = latest_version(self.models_dir)
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Watcher de modelos activo ({self.models_dir or MODELS_DIR}, cada {self.interval_s}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                latest = latest_version(self.models_dir)
+                if latest and latest != self._last_seen:
+                    self._last_seen = latest
+                    logger.info(f"🔄 Nueva versión de modelo detectada: {latest}")
+                    self.on_new_version(latest)
+            except Exception as e:
+                logger.error(f"⚠️ Error en el watcher de modelos: {e}")
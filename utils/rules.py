@@ -0,0 +1,156 @@
+import os
+import json
+import bisect
+import logging
+import itertools
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Archivo con las reglas del pre-filtro (vacío = pre-filtro desactivado)
+RULES_PATH = os.getenv("RULES_PATH", "")
+
+DECISIONES = ("APPROVE", "BLOCK")
+
+# Campos que pueden usar las reglas y sus valores posibles (los categóricos)
+CAMPOS_NUMERICOS = ("amount", "hour", "account_age")
+CAMPOS_CATEGORICOS = {
+    "transaction_type": ("Online Purchase", "ATM Withdrawal", "POS Purchase", "Bank Transfer"),
+    "customer_segment": ("Retail", "Business", "Corporate"),
+}
+
+# Operadores numéricos: (incluye el valor del límite en la celda superior?, test)
+OPERADORES = {
+    "gte": (True, lambda x, v: x >= v),
+    "gt": (False, lambda x, v: x > v),
+    "lt": (True, lambda x, v: x < v),
+    "lte": (False, lambda x, v: x <= v),
+}
+
+# =========================================================
+# REGLAS DECLARATIVAS
+# =========================================================
+# Cada regla es un dict:
+#   {"name": "...", "decision": "APPROVE" | "BLOCK",
+#    "when": {"amount": {"lt": 1000}, "hour": {"gte": 9, "lt": 17},
+#             "transaction_type": {"in": ["Online Purchase"]}}}
+# Las condiciones de una regla se combinan con AND; gana la primera regla que aplica.
+
+def validar_reglas(reglas):
+    nombres = set()
+    for regla in reglas:
+        nombre = regla.get("name")
+        if not nombre or nombre in nombres:
+            raise ValueError(f"Regla sin nombre o con nombre repetido: {nombre!r}")
+        nombres.add(nombre)
+        if regla.get("decision") not in DECISIONES:
+            raise ValueError(f"Regla {nombre}: decision debe ser una de {DECISIONES}")
+        for campo, condicion in regla.get("when", {}).items():
+            if campo in CAMPOS_NUMERICOS:
+                desconocidos = set(condicion) - set(OPERADORES)
+            elif campo in CAMPOS_CATEGORICOS:
+                desconocidos = set(condicion) - {"in"}
+                fuera = set(condicion.get("in", [])) - set(CAMPOS_CATEGORICOS[campo])
+                if fuera:
+                    raise ValueError(f"Regla {nombre}: valores desconocidos en {campo}: {sorted(fuera)}")
+            else:
+                raise ValueError(f"Regla {nombre}: campo desconocido {campo}")
+            if desconocidos:
+                raise ValueError(f"Regla {nombre}: operadores desconocidos en {campo}: {sorted(desconocidos)}")
+    return reglas
+
+def load_rules(path=None):
+    path = path or RULES_PATH
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return validar_reglas(data["rules"] if isinstance(data, dict) else data)
+
+def _cumple(regla, valores):
+    for campo, condicion in regla.get("when", {}).items():
+        x = valores[campo]
+        if campo in CAMPOS_CATEGORICOS:
+            if "in" in condicion and x not in condicion["in"]:
+                return False
+        elif not all(OPERADORES[op][1](x, v) for op, v in condicion.items()):
+            return False
+    return True
+
+# =========================================================
+# TABLA DE DECISIÓN COMPILADA
+# =========================================================
+class _Eje:
+    """
+    Discretiza un campo numérico en celdas según todos los límites usados por las reglas.
+
+    Un límite "gte v" / "lt v" cambia de celda en x = v; uno "gt v" / "lte v",
+    justo después de v. La celda de x es la cantidad de límites que superó.
+    """
+
+    def __init__(self, limites):
+        self.cerrados = sorted({v for v, incluye in limites if incluye})   # superado si x >= v
+        self.abiertos = sorted({v for v, incluye in limites if not incluye})  # superado si x > v
+
+        # Un punto representativo por celda para evaluar las reglas
+        ordenados = sorted([(v, 0) for v in self.cerrados] + [(v, 1) for v in self.abiertos])
+        self.representantes = [ordenados[0][0] - 1 if ordenados else 0.0]
+        for k, (v, tipo) in enumerate(ordenados):
+            if tipo == 0:
+                self.representantes.append(v)
+            else:
+                siguiente = ordenados[k + 1][0] if k + 1 < len(ordenados) else v + 2
+                self.representantes.append((v + siguiente) / 2)
+
+    def celda(self, x):
+        return bisect.bisect_right(self.cerrados, x) + bisect.bisect_left(self.abiertos, x)
+
+class RuleTable:
+    """
+    Reglas compiladas a una tabla: una celda por combinación de intervalos
+    numéricos y valores categóricos, con el índice de la primera regla que
+    aplica (o -1). Decidir cuesta unas bisecciones y una búsqueda en un dict,
+    sin importar cuántas reglas haya.
+    """
+
+    def __init__(self, reglas):
+        self.reglas = validar_reglas(list(reglas))
+
+        limites = {campo: [] for campo in CAMPOS_NUMERICOS}
+        for regla in self.reglas:
+            for campo, condicion in regla.get("when", {}).items():
+                if campo in limites:
+                    limites[campo].extend((v, OPERADORES[op][0]) for op, v in condicion.items())
+        self.ejes = {campo: _Eje(valores) for campo, valores in limites.items()}
+
+        self.tabla = {}
+        celdas = [list(enumerate(self.ejes[c].representantes)) for c in CAMPOS_NUMERICOS]
+        categorias = [CAMPOS_CATEGORICOS[c] for c in CAMPOS_CATEGORICOS]
+        for combinacion in itertools.product(*celdas, *categorias):
+            numericos, categoricos = combinacion[:len(CAMPOS_NUMERICOS)], combinacion[len(CAMPOS_NUMERICOS):]
+            valores = dict(zip(CAMPOS_NUMERICOS, (x for _, x in numericos)))
+            valores.update(zip(CAMPOS_CATEGORICOS, categoricos))
+            indice = next((i for i, regla in enumerate(self.reglas) if _cumple(regla, valores)), -1)
+            if indice >= 0:
+                self.tabla[tuple(k for k, _ in numericos) + tuple(categoricos)] = indice
+
+    def decide(self, input_data):
+        """(decision, nombre_regla) para los casos claros; None si debe decidir el modelo."""
+        clave = tuple(self.ejes[c].celda(input_data[c]) for c in CAMPOS_NUMERICOS) + tuple(
+            input_data[c] for c in CAMPOS_CATEGORICOS
+        )
+        indice = self.tabla.get(clave)
+        if indice is None:
+            return None
+        regla = self.reglas[indice]
+        return regla["decision"], regla["name"]
+
+    def __len__(self):
+        return len(self.tabla)
+
+def load_rule_table(path=None):
+    """Tabla compilada desde RULES_PATH, o None si el pre-filtro está desactivado."""
+    path = path or RULES_PATH
+    if not path:
+        return None
+    tabla = RuleTable(load_rules(path))
+    logger.info(f"✅ Pre-filtro de reglas activo: {len(tabla.reglas)} reglas, {len(tabla)} celdas decididas ({path})")
+    return tabla
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 import sys
 
@@ -38,6 +38,13 @@ class CustomerSegment(str, Enum):
     BUSINESS = 'Business'
     CORPORATE = 'Corporate'
 
+class ExplainMode(str, Enum):
+    NONE = 'none'    # Solo puntaje (el gráfico se puede pedir luego en /explain/{id})
+    TEXT = 'text'    # Puntaje + texto explicativo
+    IMAGE = 'image'  # Puntaje + texto + gráfico en Base64
+    SVG = 'svg'      # Puntaje + texto + gráfico SVG liviano (sin matplotlib)
+    CONTRIBUTIONS = 'contributions'  # Puntaje + texto + contribuciones para dibujar en el cliente
+
 # --- 2. INPUT (Datos que recibimos del formulario) ---
 class TransactionRequest(BaseModel):
     amount: float = Field(..., gt=0, description="El monto de la transacción. Debe ser mayor a 0.")
@@ -50,6 +57,10 @@ class TransactionRequest(BaseModel):
     
     customer_segment: CustomerSegment = Field(..., description="Segmento del cliente.")
 
+    explain: ExplainMode = Field(ExplainMode.IMAGE, description="Nivel de explicación en la respuesta: none, text, image, svg o contributions.")
+
+    account_id: Optional[str] = Field(None, min_length=1, max_length=128, description="Identificador de la cuenta (opcional). Activa las reglas de velocidad por cuenta.")
+
     # Nota: No pedimos 'risk_score' aquí porque eso lo calculamos nosotros internamente.
     # Tampoco pedimos 'gender' porque lo eliminamos del modelo.
 
@@ -67,10 +78,54 @@ class TransactionRequest(BaseModel):
 
 # --- 3. OUTPUT (Datos que devolvemos al frontend) ---
 class PredictionResponse(BaseModel):
-    probability_percent: float = Field(..., description="Probabilidad de fraude en porcentaje (0-100).")
+    probability_percent: Optional[float] = Field(None, description="Probabilidad de fraude en porcentaje (0-100). Nula si decidió una regla (decided_by) sin evaluar el modelo.")
     is_fraud: bool = Field(..., description="Booleano final: True si se debe bloquear, False si se aprueba.")
-    risk_score_input: int = Field(..., description="El puntaje de riesgo calculado por nuestras reglas de negocio.")
+    risk_score_input: Optional[int] = Field(None, description="El puntaje de riesgo calculado por nuestras reglas de negocio. Nulo si decidió una regla.")
     alert_messages: List[str] = Field(default=[], description="Lista de mensajes explicativos o advertencias.")
     shap_image_base64: Optional[str] = Field(None, description="Imagen del gráfico SHAP codificada en Base64 para mostrar en HTML.")
     ai_explanation: Optional[str] = Field(None, description="Explicación generada por IA sobre la decisión tomada.")
-    risk_level: Optional[str] = Field(None, description="Nivel de riesgo: LOW, MEDIUM o HIGH.")
\ No newline at end of file
+    risk_level: Optional[str] = Field(None, description="Nivel de riesgo: LOW, MEDIUM o HIGH.")
+    prediction_id: Optional[str] = Field(None, description="Identificador para consultar la explicación en /explain/{prediction_id}.")
+    model_version: Optional[str] = Field(None, description="Versión del modelo que generó la predicción.")
+    velocity: Optional[Dict[str, float]] = Field(None, description="Conteo, monto y canales de la cuenta en 1m/1h/24h (solo con account_id).")
+    shap_svg: Optional[str] = Field(None, description="Gráfico explicativo en SVG (explain=svg).")
+    contributions: Optional[Dict[str, float]] = Field(None, description="Impacto de cada factor en la decisión (explain=contributions).")
+    decided_by: Optional[str] = Field(None, description="Quién decidió: 'model' o 'rule:<nombre>' (pre-filtro de reglas).")
+
+class ExplanationResponse(BaseModel):
+    prediction_id: str = Field(..., description="Identificador de la predicción explicada.")
+    shap_image_base64: Optional[str] = Field(None, description="Imagen del gráfico SHAP codificada en Base64.")
+    ai_explanation: Optional[str] = Field(None, description="Explicación generada por IA sobre la decisión tomada.")
+
+# --- 4. LOTES (Scoring masivo desde el gateway) ---
+class BatchTransactionRequest(BaseModel):
+    items: List[TransactionRequest] = Field(..., min_length=1, max_length=10000, description="Transacciones a evaluar en una sola llamada (máx. 10.000).")
+
+class BatchPredictionResponse(BaseModel):
+    count: int = Field(..., description="Cantidad de transacciones evaluadas.")
+    results: List[PredictionResponse] = Field(default=[], description="Resultados en el mismo orden que los items recibidos.")
+
+# --- 5. ADMINISTRACIÓN DEL MODELO ---
+class ModelReloadRequest(BaseModel):
+    version: Optional[str] = Field(None, description="Versión del registro a cargar. Si se omite, se usa la más reciente.")
+
+# --- 6. ESTADÍSTICAS (rollups de auditoría) ---
+class StatsDimension(str, Enum):
+    HOUR = 'hour'        # Hora del día de la transacción
+    SEGMENT = 'segment'  # Segmento del cliente
+    CHANNEL = 'channel'  # Tipo de transacción
+
+class FraudRateBucket(BaseModel):
+    key: str = Field(..., description="Valor de la dimensión (hora, segmento o canal).")
+    total: int = Field(..., description="Transacciones evaluadas.")
+    blocked: int = Field(..., description="Transacciones bloqueadas (is_fraud).")
+    fraud_rate: float = Field(..., description="Fracción bloqueada (0-1).")
+    mean_probability: Optional[float] = Field(None, description="Probabilidad de fraude media (0-1) de las transacciones que evaluó el modelo (sin las decididas por reglas).")
+    risk_levels: Dict[str, int] = Field(default={}, description="Transacciones por nivel de riesgo.")
+
+class FraudRateResponse(BaseModel):
+    dimension: StatsDimension
+    days: int = Field(..., description="Días incluidos, contando hoy (UTC).")
+    since: str = Field(..., description="Primer día incluido (YYYY-MM-DD).")
+    total: int = Field(..., description="Transacciones en el período.")
+    buckets: List[FraudRateBucket] = Field(default=[], description="Una entrada por valor de la dimensión.")
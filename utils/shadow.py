@@ -0,0 +1,285 @@
+import os
+import time
+import uuid
+import random
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import utils.metrics as metrics
+import utils.registry as registry
+from utils.workers import WEB_CONCURRENCY
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fracción de las transacciones puntuadas por el modelo que también puntúa el challenger (0 = apagado)
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0"))
+# Versión del challenger (vacío = la más reciente de CHALLENGER_DIR)
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION", "")
+# Registro aparte para que el watcher nunca lo tome como campeón
+CHALLENGER_DIR = os.getenv("CHALLENGER_DIR", os.path.join(registry.MODELS_DIR, "challenger"))
+# Procesos del pool en sombra y transacciones en vuelo antes de descartar muestras
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "2000"))
+# Prioridad (nice) de los procesos en sombra: ceden la CPU al camino del request
+SHADOW_NICE = int(os.getenv("SHADOW_NICE", "10"))
+
+CAMPOS_ENTRADA = ("amount", "hour", "account_age", "transaction_type", "customer_segment")
+
+# =========================================================
+# PROCESO EN SOMBRA
+# =========================================================
+# El challenger vive solo en los procesos del pool: no ocupa memoria ni el
+# GIL del proceso que atiende requests.
+_CHALLENGER = None
+
+def _init_worker(path, version, nice):
+    global _CHALLENGER
+    logging.disable(logging.INFO)
+    if nice:
+        os.nice(nice)
+
+    import utils.inference as inference
+
+    modelo = inference._preparar_modelo(path, version)
+    # Un hilo por proceso: el paralelismo lo da el pool, no el bosque
+    if modelo.pipeline is not None:
+        modelo.pipeline.steps[-1][1].set_params(n_jobs=1)
+    _CHALLENGER = modelo
+
+def _puntuar(items):
+    """Probabilidades del challenger y segundos que tardó en calcularlas."""
+    import utils.inference as inference
+
+    inicio = time.perf_counter()
+    probs = inference._score(items, _CHALLENGER)
+    return [float(p) for p in probs], time.perf_counter() - inicio
+
+# =========================================================
+# COMPARACIÓN CAMPEÓN / CHALLENGER
+# =========================================================
+def _percentiles_ms(valores):
+    if not valores:
+        return None
+    p50, p95, p99 = np.percentile(np.asarray(valores) * 1000, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+class ShadowScorer:
+    """
+    Puntúa con un modelo challenger una muestra de las transacciones que ya
+    respondió el campeón, en un pool de procesos de baja prioridad.
+
+    `submit()` solo sortea la muestra y encola el trabajo: nunca espera al
+    challenger. Si hay más de `max_pending` transacciones en vuelo, la muestra
+    se descarta (y se cuenta) en vez de acumular cola. Por cada transacción
+    se compara la probabilidad y la acción (APPROVE / REVIEW / BLOCK) de
+    ambos modelos; `on_result(documento)`, si se indica, recibe cada par de
+    puntajes (p. ej. para guardarlo en Mongo).
+    """
+
+    def __init__(self, path, version, sample_rate=SHADOW_SAMPLE_RATE, workers=SHADOW_WORKERS,
+                 max_pending=SHADOW_MAX_PENDING, nice=SHADOW_NICE, on_result=None):
+        self.version = version
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.max_pending = max_pending
+        self.on_result = on_result
+
+        # spawn: el hijo no hereda hilos ni locks del servidor a mitad de uso
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(path, version, nice),
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.activo = True
+
+        self.stats = {"sampled": 0, "scored": 0, "dropped": 0, "errors": 0, "agreements": 0}
+        self._confusion = {}
+        self._diff_sum = 0.0
+        self._diff_max = 0.0
+        self._latencias = deque(maxlen=1000)          # segundos por llamada del challenger
+        self._latencias_campeon = deque(maxlen=1000)  # segundos por llamada del campeón
+        self._items = deque(maxlen=1000)
+        self._items_campeon = deque(maxlen=1000)
+        self._desacuerdos = deque(maxlen=20)
+        self.champion_version = None
+
+    def start(self):
+        """Levanta el pool y lo calienta con transacciones sintéticas (sin bloquear)."""
+        from utils.compiled import generar_muestras
+
+        futuro = self._pool.submit(_puntuar, generar_muestras(n=20, seed=2))
+        futuro.add_done_callback(self._verificar_arranque)
+        logger.info(f"👥 Challenger {self.version} en sombra sobre el {self.sample_rate:.1%} del tráfico "
+                    f"({self.workers} procesos).")
+
+    def _verificar_arranque(self, futuro):
+        try:
+            futuro.result()
+        except Exception as e:
+            self.activo = False
+            metrics.ERRORS.inc("shadow")
+            logger.error(f"❌ El challenger {self.version} no pudo cargarse, modo sombra desactivado: {e}")
+
+    def stop(self):
+        self.activo = False
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, items, champion_probs, champion_version, champion_timing=None):
+        """
+        Envía una muestra del lote al challenger; vuelve de inmediato.
+        `champion_timing` es (segundos, filas) de la evaluación del campeón, o
+        None si todo el lote salió de la caché (no cuenta para su latencia).
+        """
+        if not self.activo:
+            return
+        muestra = [i for i in range(len(items)) if random.random() < self.sample_rate]
+        if not muestra:
+            return
+
+        with self._lock:
+            self.stats["sampled"] += len(muestra)
+            if champion_timing is not None:
+                segundos, filas = champion_timing
+                self._latencias_campeon.append(segundos)
+                self._items_campeon.append(filas)
+            if self._pending + len(muestra) > self.max_pending:
+                self.stats["dropped"] += len(muestra)
+                return
+            self._pending += len(muestra)
+
+        entradas = [{campo: items[i][campo] for campo in CAMPOS_ENTRADA} for i in muestra]
+        campeon = [float(champion_probs[i]) for i in muestra]
+        try:
+            futuro = self._pool.submit(_puntuar, entradas)
+        except Exception as e:
+            # Pool roto o cerrado: el request sigue como si nada
+            with self._lock:
+                self._pending -= len(muestra)
+                self.stats["errors"] += len(muestra)
+            self.activo = False
+            logger.error(f"❌ Pool en sombra no disponible, modo sombra desactivado: {e}")
+            return
+        futuro.add_done_callback(
+            lambda f: self._registrar(f, entradas, campeon, champion_version)
+        )
+
+    def _registrar(self, futuro, entradas, campeon, champion_version):
+        from utils.inference import clasificar_riesgo
+
+        with self._lock:
+            self._pending -= len(entradas)
+        try:
+            retador, segundos = futuro.result()
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += len(entradas)
+            metrics.ERRORS.inc("shadow")
+            logger.error(f"⚠️ Error puntuando en sombra: {e}")
+            return
+
+        acciones_campeon = [str(a) for a in clasificar_riesgo(campeon)[1]]
+        acciones_retador = [str(a) for a in clasificar_riesgo(retador)[1]]
+        diferencias = np.abs(np.asarray(campeon) - np.asarray(retador))
+        timestamp = datetime.utcnow()
+
+        with self._lock:
+            self.champion_version = champion_version
+            self.stats["scored"] += len(entradas)
+            self._latencias.append(segundos)
+            self._items.append(len(entradas))
+            self._diff_sum += float(diferencias.sum())
+            self._diff_max = max(self._diff_max, float(diferencias.max()))
+            for entrada, a, b, p, q in zip(entradas, acciones_campeon, acciones_retador, campeon, retador):
+                self._confusion[(a, b)] = self._confusion.get((a, b), 0) + 1
+                if a == b:
+                    self.stats["agreements"] += 1
+                else:
+                    self._desacuerdos.append({
+                        "input": entrada,
+                        "champion": {"probability": round(p, 4), "action": a},
+                        "challenger": {"probability": round(q, 4), "action": b},
+                    })
+
+        if self.on_result is not None:
+            for entrada, a, b, p, q in zip(entradas, acciones_campeon, acciones_retador, campeon, retador):
+                self.on_result({
+                    "_id": uuid.uuid4().hex,
+                    "timestamp": timestamp,
+                    "input": entrada,
+                    "champion": {"version": champion_version, "probability": p, "action": a},
+                    "challenger": {"version": self.version, "probability": q, "action": b},
+                    "agree": a == b,
+                })
+
+    # -----------------------------------------------------
+    # Estadísticas
+    # -----------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            scored = self.stats["scored"]
+            return {
+                "active": self.activo,
+                "champion_version": self.champion_version,
+                "challenger_version": self.version,
+                "sample_rate": self.sample_rate,
+                **self.stats,
+                "pending": self._pending,
+                "agreement_rate": round(self.stats["agreements"] / scored, 4) if scored else None,
+                "mean_abs_diff": round(self._diff_sum / scored, 6) if scored else None,
+                "max_abs_diff": round(self._diff_max, 6) if scored else None,
+                "confusion": {f"{a}->{b}": n for (a, b), n in sorted(self._confusion.items())},
+                "latency_ms": {
+                    "champion": _percentiles_ms(list(self._latencias_campeon)),
+                    "challenger": _percentiles_ms(list(self._latencias)),
+                    "champion_per_tx_us": round(sum(self._latencias_campeon) / sum(self._items_campeon) * 1e6, 1)
+                    if self._items_campeon else None,
+                    "challenger_per_tx_us": round(sum(self._latencias) / sum(self._items) * 1e6, 1)
+                    if self._items else None,
+                },
+                "recent_disagreements": list(self._desacuerdos),
+            }
+
+    def metricas(self):
+        stats = self.snapshot()
+        familias = {
+            f"fraudguard_shadow_{nombre}_total": ("counter", f"Modo sombra: {nombre}.", {(): stats[nombre]})
+            for nombre in ("sampled", "scored", "dropped", "errors", "agreements")
+        }
+        familias["fraudguard_shadow_pending"] = (
+            "gauge", "Transacciones en vuelo hacia el challenger.", {(): stats["pending"]}
+        )
+        return familias
+
+# =========================================================
+# CARGA
+# =========================================================
+def resolver_challenger(version=None):
+    """(ruta, versión) del challenger en CHALLENGER_DIR."""
+    version = version or SHADOW_MODEL_VERSION or registry.latest_version(CHALLENGER_DIR)
+    if version is None:
+        raise FileNotFoundError(f"No hay modelos challenger en {CHALLENGER_DIR}")
+    return registry.model_path(version, CHALLENGER_DIR), version
+
+def start_shadow(on_result=None):
+    """ShadowScorer activo si SHADOW_SAMPLE_RATE > 0; None si el modo sombra está apagado."""
+    if SHADOW_SAMPLE_RATE <= 0:
+        return None
+    path, version = resolver_challenger()
+    if WEB_CONCURRENCY > 1:
+        # Cada worker levanta su propio pool con el challenger completo (.pkl)
+        logger.warning(f"⚠️ Modo sombra con {WEB_CONCURRENCY} workers: {WEB_CONCURRENCY * SHADOW_WORKERS} "
+                       f"procesos challenger, cada uno con su copia del modelo.")
+    scorer = ShadowScorer(path, version, on_result=on_result)
+    scorer.start()
+    metrics.register_collector(lambda: scorer.metricas())
+    return scorer
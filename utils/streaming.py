@@ -0,0 +1,89 @@
+import os
+import asyncio
+import logging
+
+from starlette.responses import StreamingResponse
+
+from utils.batching import recolectar_lote
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Micro-lotes móviles por conexión y lectura anticipada máxima (backpressure)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "256"))
+STREAM_MAX_WAIT_MS = float(os.getenv("STREAM_MAX_WAIT_MS", "10"))
+STREAM_MAX_PENDING = int(os.getenv("STREAM_MAX_PENDING", "1024"))
+
+_FIN = object()
+
+# =========================================================
+# SCORING DE UN FLUJO CONTINUO
+# =========================================================
+async def score_stream(items, score_fn, batch_size=STREAM_BATCH_SIZE,
+                       max_wait_ms=STREAM_MAX_WAIT_MS, max_pending=STREAM_MAX_PENDING):
+    """
+    Puntúa un flujo asíncrono de items en micro-lotes y entrega los resultados en orden.
+
+    Una tarea lee `items` hacia una cola acotada (`max_pending`); cuando se
+    llena, deja de leer y el cliente queda frenado por TCP. El lote se arma
+    con lo que haya en cola (hasta `batch_size`, o lo que llegue en
+    `max_wait_ms`) y `score_fn(lote)` corre en un hilo. Como esto es un
+    generador, no se puntúa el lote siguiente hasta que el llamador haya
+    consumido (enviado) los resultados del anterior.
+    """
+    cola = asyncio.Queue(maxsize=max(1, int(max_pending)))
+    loop = asyncio.get_running_loop()
+
+    async def leer():
+        try:
+            async for item in items:
+                await cola.put(item)
+        except Exception as e:
+            # Cliente desconectado o body cortado: se entrega lo ya leído
+            logger.warning(f"⚠️ Flujo de entrada cortado: {e}")
+        await cola.put(_FIN)
+
+    lector = asyncio.create_task(leer())
+    try:
+        terminado = False
+        while not terminado:
+            lote = await recolectar_lote(cola, batch_size, max_wait_ms / 1000.0)
+            if _FIN in lote:
+                lote = lote[:lote.index(_FIN)]
+                terminado = True
+            if not lote:
+                continue
+
+            for resultado in await loop.run_in_executor(None, score_fn, lote):
+                yield resultado
+    finally:
+        lector.cancel()
+        await asyncio.gather(lector, return_exceptions=True)
+
+async def lineas(chunks):
+    """Bytes en trozos arbitrarios -> líneas de texto no vacías (NDJSON)."""
+    resto = b""
+    async for chunk in chunks:
+        resto += chunk
+        *completas, resto = resto.split(b"\n")
+        for linea in completas:
+            if linea.strip():
+                yield linea.decode("utf-8")
+    if resto.strip():
+        yield resto.decode("utf-8")
+
+# =========================================================
+# RESPUESTA HTTP FULL-DUPLEX
+# =========================================================
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que no escucha el canal de recepción mientras envía.
+
+    Con ASGI < 2.4 Starlette consume `receive()` en paralelo para detectar la
+    desconexión, y se llevaría los trozos del body que el generador todavía
+    está leyendo. Aquí el body lo lee solo el generador; una desconexión se
+    nota al fallar la lectura o el envío.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
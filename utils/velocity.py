@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cuentas retenidas en memoria (LRU) y tiempo sin actividad antes de descartarlas
+VELOCITY_MAX_ACCOUNTS = int(os.getenv("VELOCITY_MAX_ACCOUNTS", "50000"))
+VELOCITY_IDLE_S = float(os.getenv("VELOCITY_IDLE_S", "86400"))
+VELOCITY_SNAPSHOT_PATH = os.getenv("VELOCITY_SNAPSHOT_PATH", "velocity_snapshot.json")
+
+# =========================================================
+# VENTANAS DESLIZANTES
+# =========================================================
+# Cada ventana es un anillo de buckets de ancho fijo: (nombre, duración en s, buckets).
+# La ventana efectiva cubre entre (buckets - 1) y buckets anchos de bucket.
+VENTANAS = (("1m", 60, 6), ("1h", 3600, 12), ("24h", 86400, 24))
+_OFFSETS = [sum(n for _, _, n in VENTANAS[:i]) for i in range(len(VENTANAS))]
+_TOTAL_BUCKETS = sum(n for _, _, n in VENTANAS)
+
+# Cuentas copiadas por cada toma del lock en snapshot()
+_CUENTAS_POR_TRAMO = 1000
+
+# Un bit por canal: los canales distintos son el popcount del OR de los buckets
+CANALES = {"Online Purchase": 1, "ATM Withdrawal": 2, "POS Purchase": 4, "Bank Transfer": 8}
+
+class _Cuenta:
+    """Anillos de todas las ventanas de una cuenta en arrays planos (~1 KB por cuenta)."""
+
+    __slots__ = ("last_seen", "epocas", "conteos", "sumas", "canales")
+
+    def __init__(self):
+        self.last_seen = 0.0
+        self.epocas = [0] * len(VENTANAS)  # última época (índice de bucket absoluto) de cada anillo
+        self.conteos = array("I", bytes(4 * _TOTAL_BUCKETS))
+        self.sumas = array("d", bytes(8 * _TOTAL_BUCKETS))
+        self.canales = bytearray(_TOTAL_BUCKETS)
+
+    def _avanzar(self, w, epoca):
+        """Lleva el anillo `w` hasta `epoca`, vaciando los buckets que quedaron fuera."""
+        _, duracion, n = VENTANAS[w]
+        ultima = self.epocas[w]
+        if epoca <= ultima:
+            return
+        base = _OFFSETS[w]
+        for e in range(ultima + 1, ultima + 1 + min(epoca - ultima, n)):
+            i = base + e % n
+            self.conteos[i] = 0
+            self.sumas[i] = 0.0
+            self.canales[i] = 0
+        self.epocas[w] = epoca
+
+    def agregar(self, t, monto, canal):
+        for w, (_, duracion, n) in enumerate(VENTANAS):
+            epoca = int(t // (duracion / n))
+            self._avanzar(w, epoca)
+            # Un evento con reloj atrasado cae en el bucket más reciente
+            i = _OFFSETS[w] + max(epoca, self.epocas[w]) % n
+            self.conteos[i] += 1
+            self.sumas[i] += monto
+            self.canales[i] |= canal
+        self.last_seen = max(self.last_seen, t)
+
+    def resumen(self, t):
+        resultado = {}
+        for w, (nombre, duracion, n) in enumerate(VENTANAS):
+            self._avanzar(w, int(t // (duracion / n)))
+            base = _OFFSETS[w]
+            mascara = 0
+            for c in self.canales[base:base + n]:
+                mascara |= c
+            resultado[f"count_{nombre}"] = sum(self.conteos[base:base + n])
+            resultado[f"amount_{nombre}"] = round(sum(self.sumas[base:base + n]), 2)
+            resultado[f"channels_{nombre}"] = bin(mascara).count("1")
+        return resultado
+
+    def fusionar(self, otra):
+        """Suma otra copia de la misma cuenta (p. ej. de otro worker), bucket a bucket del mismo período."""
+        for w in range(len(VENTANAS)):
+            # Con ambos anillos en la misma época, cada posición es el mismo bucket de tiempo
+            epoca = max(self.epocas[w], otra.epocas[w])
+            self._avanzar(w, epoca)
+            otra._avanzar(w, epoca)
+        for i in range(_TOTAL_BUCKETS):
+            self.conteos[i] += otra.conteos[i]
+            self.sumas[i] += otra.sumas[i]
+            self.canales[i] |= otra.canales[i]
+        self.last_seen = max(self.last_seen, otra.last_seen)
+
+    def copia_cruda(self):
+        """Estado en bytes (copias de memoria, sin recorrer los buckets): lo que toma snapshot() bajo el lock."""
+        return self.last_seen, list(self.epocas), bytes(self.conteos), bytes(self.sumas), bytes(self.canales)
+
+    @classmethod
+    def from_bytes(cls, last_seen, epocas, conteos, sumas, canales):
+        cuenta = cls()
+        cuenta.last_seen, cuenta.epocas = last_seen, list(epocas)
+        cuenta.conteos = array("I", conteos)
+        cuenta.sumas = array("d", sumas)
+        cuenta.canales = bytearray(canales)
+        return cuenta
+
+    @classmethod
+    def from_json(cls, data):
+        """Cuenta en el formato de snapshot anterior (listas por cuenta)."""
+        cuenta = cls()
+        cuenta.last_seen, cuenta.epocas = data[0], list(data[1])
+        cuenta.conteos = array("I", data[2])
+        cuenta.sumas = array("d", data[3])
+        cuenta.canales = bytearray(data[4])
+        return cuenta
+
+# =========================================================
+# ALMACÉN DE VELOCIDAD POR CUENTA
+# =========================================================
+class VelocityStore:
+    """
+    Conteo, suma de montos y canales distintos por cuenta en ventanas de
+    1 minuto, 1 hora y 24 horas, en memoria del proceso.
+
+    Cada actualización toca un bucket por ventana (O(1)); la memoria está
+    acotada a `max_accounts` cuentas (LRU) y las cuentas sin actividad en
+    `idle_s` segundos se descartan. `snapshot()` / `restore()` persisten el
+    estado en un JSON para sobrevivir reinicios; `restore()` suma las cuentas
+    que ya estaban en memoria (snapshots de varios workers).
+    """
+
+    def __init__(self, max_accounts=VELOCITY_MAX_ACCOUNTS, idle_s=VELOCITY_IDLE_S):
+        self.max_accounts = max_accounts
+        self.idle_s = idle_s
+        self._cuentas = OrderedDict()  # account_id -> _Cuenta, de la menos a la más reciente
+        self._lock = threading.Lock()
+        self.stats = {"evicted_idle": 0, "evicted_lru": 0}
+
+    def record(self, account_id, amount, transaction_type, now=None):
+        """Registra la transacción y devuelve las ventanas de la cuenta (incluyéndola)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cuenta = self._cuentas.get(account_id)
+            if cuenta is None:
+                cuenta = self._cuentas[account_id] = _Cuenta()
+            else:
+                self._cuentas.move_to_end(account_id)
+            cuenta.agregar(now, float(amount), CANALES.get(transaction_type, 0))
+            resumen = cuenta.resumen(now)
+            self._purge(now)
+        return resumen
+
+    def get(self, account_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            cuenta = self._cuentas.get(account_id)
+            return cuenta.resumen(now) if cuenta is not None else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cuentas)
+
+    def _purge(self, now):
+        # Orden LRU = orden de última actividad: basta mirar el frente
+        while self._cuentas:
+            account_id, cuenta = next(iter(self._cuentas.items()))
+            if len(self._cuentas) > self.max_accounts:
+                self.stats["evicted_lru"] += 1
+            elif now - cuenta.last_seen > self.idle_s:
+                self.stats["evicted_idle"] += 1
+            else:
+                break
+            del self._cuentas[account_id]
+
+    # -----------------------------------------------------
+    # Persistencia
+    # -----------------------------------------------------
+    def snapshot(self, path=VELOCITY_SNAPSHOT_PATH):
+        # Bajo el lock solo se copian bytes, y por tramos: record() está en el camino
+        # del request y no debe esperar a que se copien todas las cuentas
+        with self._lock:
+            cuentas = list(self._cuentas.items())
+        copias = []
+        for i in range(0, len(cuentas), _CUENTAS_POR_TRAMO):
+            with self._lock:
+                copias.extend((account_id, *cuenta.copia_cruda())
+                              for account_id, cuenta in cuentas[i:i + _CUENTAS_POR_TRAMO])
+
+        # Los buckets de todas las cuentas van juntos en base64 (bytes nativos del array):
+        # json.dumps (encoder en C) solo recorre los ids, las fechas y las épocas
+        ids, last_seen, epocas, conteos, sumas, canales = zip(*copias) if copias else ([],) * 6
+        texto = json.dumps({
+            "saved_at": time.time(),
+            "windows": VENTANAS,
+            "format": 2,
+            "accounts": list(ids),
+            "last_seen": list(last_seen),
+            "epochs": list(epocas),
+            "counts": base64.b64encode(b"".join(conteos)).decode("ascii"),
+            "sums": base64.b64encode(b"".join(sumas)).decode("ascii"),
+            "channels": base64.b64encode(b"".join(canales)).decode("ascii"),
+        })
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Snapshot de velocidad guardado: {len(copias)} cuentas en {path}")
+        return len(copias)
+
+    @staticmethod
+    def _leer_cuentas(data):
+        """(account_id, _Cuenta) de un snapshot, en el formato actual o en el anterior."""
+        if data.get("format") != 2:
+            return [(account_id, _Cuenta.from_json(raw)) for account_id, raw in data["accounts"].items()]
+
+        conteos = base64.b64decode(data["counts"])
+        sumas = base64.b64decode(data["sums"])
+        canales = base64.b64decode(data["channels"])
+        n_i, n_d = 4 * _TOTAL_BUCKETS, 8 * _TOTAL_BUCKETS
+        return [
+            (account_id, _Cuenta.from_bytes(
+                last_seen, epocas,
+                conteos[k * n_i:(k + 1) * n_i], sumas[k * n_d:(k + 1) * n_d],
+                canales[k * _TOTAL_BUCKETS:(k + 1) * _TOTAL_BUCKETS],
+            ))
+            for k, (account_id, last_seen, epocas) in enumerate(zip(data["accounts"], data["last_seen"], data["epochs"]))
+        ]
+
+    def restore(self, path=VELOCITY_SNAPSHOT_PATH, now=None):
+        """
+        Carga un snapshot previo; ignora cuentas vencidas o un snapshot con
+        otras ventanas. Una cuenta que ya está en memoria no se reemplaza: se
+        suman sus buckets (varios snapshots de workers de la misma cuenta).
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if [tuple(v) for v in data.get("windows", [])] != list(VENTANAS):
+            logger.warning(f"⚠️ Snapshot de velocidad con otras ventanas, se ignora: {path}")
+            return 0
+
+        now = time.time() if now is None else now
+        cuentas = self._leer_cuentas(data)
+        with self._lock:
+            for account_id, cuenta in cuentas:
+                if now - cuenta.last_seen > self.idle_s:
+                    continue
+                actual = self._cuentas.get(account_id)
+                if actual is None:
+                    self._cuentas[account_id] = cuenta
+                else:
+                    actual.fusionar(cuenta)
+            # Orden LRU por última actividad, como si las cuentas hubieran llegado en vivo
+            self._cuentas = OrderedDict(sorted(self._cuentas.items(), key=lambda item: item[1].last_seen))
+            self._purge(now)
+            total = len(self._cuentas)
+        logger.info(f"✅ Velocidad restaurada: {total} cuentas desde {path}")
+        return total
+
+class SnapshotWriter:
+    """Guarda un snapshot del almacén cada `interval_s` segundos en un hilo de fondo."""
+
+    def __init__(self, store, interval_s, path=VELOCITY_SNAPSHOT_PATH):
+        self.store = store
+        self.interval_s = interval_s
+        self.path = path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="velocity-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            if not len(self.store):
+                continue
+            try:
+                self.store.snapshot(self.path)
+            except Exception as e:
+                logger.error(f"⚠️ Error guardando el snapshot de velocidad: {e}")
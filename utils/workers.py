@@ -0,0 +1,74 @@
+import os
+import re
+import glob
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Workers de uvicorn que comparten la carpeta de trabajo (serve.py la fija antes de arrancarlos)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# =========================================================
+# ARCHIVOS LOCALES POR PROCESO
+# =========================================================
+# El spool de Mongo y el snapshot de velocidad son de un solo proceso. Con
+# varios workers cada uno escribe en `<ruta>.<pid>`; al arrancar, un worker
+# adopta los archivos de procesos que ya no existen (la ejecución anterior o
+# un worker caído) para que nada quede sin reenviar ni restaurar.
+
+def ruta_propia(path):
+    """`path` con un solo proceso; `path.<pid>` con varios workers."""
+    if WEB_CONCURRENCY <= 1:
+        return path
+    return f"{path}.{os.getpid()}"
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _huerfanos(path):
+    propios = {ruta_propia(path), ruta_propia(path) + ".replay"}
+    patron = re.compile(re.escape(path) + r"(?:\.(\d+))?(?:\.replay|\.claimed\d+)?")
+
+    huerfanos = []
+    for candidato in sorted(glob.glob(glob.escape(path) + "*")):
+        coincidencia = patron.fullmatch(candidato)
+        if coincidencia is None or candidato in propios:
+            continue
+        pid = coincidencia.group(1)
+        if pid is None or int(pid) == os.getpid() or not _vivo(int(pid)):
+            huerfanos.append(candidato)
+    return huerfanos
+
+def reclamar_huerfanos(path):
+    """
+    Renombra a `path.<pid>.claimed<n>` los archivos de `path` que no son de
+    ningún proceso vivo y devuelve las rutas nuevas. El renombre es atómico:
+    si dos workers arrancan a la vez, cada archivo lo toma uno solo.
+    """
+    reclamados = []
+    n = 0
+    for huerfano in _huerfanos(path):
+        if re.fullmatch(re.escape(f"{path}.{os.getpid()}") + r"\.claimed\d+", huerfano):
+            # Ya reclamado por un proceso anterior con el mismo pid
+            reclamados.append(huerfano)
+            continue
+        # Solo este proceso crea nombres con su pid: basta saltear los que ya existen
+        while os.path.exists(f"{path}.{os.getpid()}.claimed{n}"):
+            n += 1
+        destino = f"{path}.{os.getpid()}.claimed{n}"
+        try:
+            os.rename(huerfano, destino)
+        except FileNotFoundError:
+            continue  # lo tomó otro worker
+        reclamados.append(destino)
+
+    if reclamados:
+        logger.info(f"📦 {len(reclamados)} archivos de procesos anteriores adoptados ({path})")
+    return reclamados